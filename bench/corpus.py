@@ -0,0 +1,221 @@
+"""
+
+    bench.corpus -- generated corpus of pages for benchmarks
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Pages are generated from a fixed seed, so the same corpus is produced
+    on every machine without checking megabytes of HTML in. Categories are
+    small blog posts, huge forum threads, table layout sites and pages in
+    legacy (non UTF-8) encodings, some of which declare their encoding and
+    some of which leave it for chardet to guess.
+
+"""
+
+import os
+import json
+import random
+
+from docopt import docopt
+
+import justext
+
+SEED = 20130101
+
+# categories and their number of pages at scale 1, legacy pages are blog
+# posts in other languages
+CATEGORIES = (
+    ('blog', 40),
+    ('forum', 3),
+    ('table', 15),
+    ('legacy', 15),
+    )
+
+# (language, encoding, letters of made up words)
+_legacy = (
+    ('Russian', 'windows-1251',
+        u''.join(unichr(c) for c in range(0x430, 0x450))),
+    ('German', 'iso-8859-1', u'abcdefghiklmnoprstuvwz\xe4\xf6\xfc\xdf'),
+    ('French', 'iso-8859-1', u'abcdefgilmnoprstuv\xe9\xe8\xea\xe0\xe7'),
+    )
+
+class _Writer(object):
+    """ Makes up text in ``language`` with a realistic share of its
+    stopwords, so justext classifies paragraphs as it would on real pages"""
+
+    def __init__(self, rnd, language='English',
+            letters=u'abcdefghiklmnoprstu'):
+        self.rnd = rnd
+        self.stopwords = sorted(
+            w for w in justext.get_stoplist(language) if w.isalpha())
+        self.words = [
+            u''.join(rnd.choice(letters) for _ in range(rnd.randint(3, 10)))
+            for _ in range(2000)]
+
+    def phrase(self, count):
+        rnd = self.rnd
+        return u' '.join(
+            rnd.choice(self.stopwords) if rnd.random() < 0.4
+            else rnd.choice(self.words)
+            for _ in range(count))
+
+    def sentence(self, low=6, high=20):
+        text = self.phrase(self.rnd.randint(low, high))
+        return text[0].upper() + text[1:] + u'.'
+
+    def paragraph(self, low=2, high=8):
+        return u' '.join(
+            self.sentence() for _ in range(self.rnd.randint(low, high)))
+
+    def title(self):
+        return self.sentence(3, 8).rstrip(u'.')
+
+def _escape(text):
+    return text.replace(u'&', u'&amp;').replace(u'<', u'&lt;')
+
+def _nav(w, cls):
+    items = u''.join(
+        u'<li><a href="/%s">%s</a></li>' % (n, _escape(w.phrase(2)))
+        for n in range(w.rnd.randint(5, 15)))
+    return u'<ul class="%s">%s</ul>' % (cls, items)
+
+def blog(w, n):
+    rnd = w.rnd
+    title = w.title()
+    head = [u'<title>%s | Blog %d</title>' % (_escape(title), n)]
+    if rnd.random() < 0.5:
+        head.append(
+            u'<meta property="og:image" content="/images/%d.jpg">' % n)
+    if rnd.random() < 0.5:
+        head.append(
+            u'<meta name="author" content="%s">' % _escape(w.phrase(2)))
+    head.append(u'<script>var analytics = {id: %d};</script>' % n)
+    body = [u'<div id="header">%s</div>' % _nav(w, 'menu')]
+    body.append(
+        u'<div class="sidebar">%s<div class="widget">%s</div></div>' % (
+            _nav(w, 'links'), _escape(w.paragraph(1, 2))))
+    article = [u'<h1>%s</h1>' % _escape(title),
+        u'<p class="byline">by <a class="author" href="/about">%s</a>'
+        u' <span class="date">2013-01-%02d</span></p>' % (
+            _escape(w.phrase(2)), n % 28 + 1)]
+    if rnd.random() < 0.7:
+        article.append(u'<img src="/uploads/%d.jpg" width="600">' % n)
+    for _ in range(rnd.randint(5, 15)):
+        article.append(u'<p>%s</p>' % _escape(w.paragraph()))
+        if rnd.random() < 0.2:
+            article.append(u'<h2>%s</h2>' % _escape(w.title()))
+    body.append(
+        u'<div class="post entry-content">%s</div>' % u''.join(article))
+    comments = u''.join(
+        u'<li class="comment"><b>%s</b><p>%s</p><a class="reply">reply</a>'
+        u'</li>' % (_escape(w.phrase(1)), _escape(w.paragraph(1, 3)))
+        for _ in range(rnd.randint(0, 20)))
+    body.append(u'<ol class="comments">%s</ol>' % comments)
+    body.append(u'<div id="footer">%s</div>' % _nav(w, 'footer-links'))
+    return u'<!DOCTYPE html><html><head>%s</head><body>%s</body></html>' % (
+        u''.join(head), u''.join(body))
+
+def forum(w, n):
+    rnd = w.rnd
+    title = w.title()
+    posts = []
+    for i in range(rnd.randint(1500, 2500)):
+        content = u''.join(
+            u'<p>%s</p>' % _escape(w.paragraph(1, 4))
+            for _ in range(rnd.randint(1, 4)))
+        if i and rnd.random() < 0.3:
+            content = u'<blockquote class="quote"><cite>%s</cite>%s' \
+                u'</blockquote>%s' % (
+                    _escape(w.phrase(1)), _escape(w.sentence()), content)
+        posts.append(
+            u'<table class="post" id="post%d"><tr>'
+            u'<td class="userinfo"><a href="/u/%d">%s</a><br>'
+            u'<img src="/avatars/%d.gif"><br>Posts: %d</td>'
+            u'<td class="message"><div class="postbody">%s</div>'
+            u'<div class="signature">%s</div>'
+            u'<div class="tools"><a>quote</a> <a>report</a></div></td>'
+            u'</tr></table>' % (
+                i, i % 97, _escape(w.phrase(1)), i % 97, rnd.randint(1, 5000),
+                content, _escape(w.sentence())))
+    return (u'<html><head><title>%s - Forum</title></head><body>'
+        u'<div id="header">%s</div><h1>%s</h1>%s<div class="pagination">'
+        u'%s</div></body></html>') % (
+            _escape(title), _nav(w, 'nav'), _escape(title), u''.join(posts),
+            _nav(w, 'pages'))
+
+def table(w, n):
+    rnd = w.rnd
+    cells = []
+    for _ in range(rnd.randint(3, 10)):
+        cells.append(
+            u'<tr><td valign="top"><font face="Verdana" size="2">%s</font>'
+            u'</td></tr>' % _escape(w.paragraph()))
+        if rnd.random() < 0.3:
+            cells.append(
+                u'<tr><td><table width="100%%"><tr><td><img src="/img/%d.gif">'
+                u'</td><td><font size="1">%s</font></td></tr></table></td>'
+                u'</tr>' % (n, _escape(w.sentence())))
+    menu = u''.join(
+        u'<tr><td bgcolor="#cccccc"><a href="/%d.html">%s</a></td></tr>' % (
+            i, _escape(w.phrase(2)))
+        for i in range(rnd.randint(8, 20)))
+    return (u'<html><head><title>%s</title></head><body bgcolor="#ffffff">'
+        u'<center><table width="780" border="0" cellpadding="0">'
+        u'<tr><td colspan="2"><img src="/banner.gif"></td></tr>'
+        u'<tr><td width="150" valign="top"><table>%s</table></td>'
+        u'<td valign="top"><table><tr><td><font size="4"><b>%s</b></font>'
+        u'</td></tr>%s</table></td></tr>'
+        u'<tr><td colspan="2"><font size="1">%s</font></td></tr>'
+        u'</table></center></body></html>') % (
+            _escape(w.title()), menu, _escape(w.title()), u''.join(cells),
+            _escape(w.sentence()))
+
+_generators = {'blog': blog, 'forum': forum, 'table': table, 'legacy': blog}
+
+def generate(directory, scale=1, seed=SEED):
+    """ Write corpus to ``directory`` along with manifest.json describing
+    its pages, ``scale`` multiplies number of pages"""
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    rnd = random.Random(seed)
+    writers = {'English': _Writer(rnd)}
+    for language, encoding, letters in _legacy:
+        writers[language] = _Writer(rnd, language, letters)
+    manifest = []
+    for category, count in CATEGORIES:
+        for n in range(count * scale):
+            language, encoding = 'English', 'utf-8'
+            if category == 'legacy':
+                language, encoding, _ = _legacy[n % len(_legacy)]
+            w = writers[language]
+            html = _generators[category](w, n)
+            declared = category != 'legacy' or rnd.random() < 0.7
+            if declared:
+                html = html.replace(u'<head>',
+                    u'<head><meta http-equiv="Content-Type"'
+                    u' content="text/html; charset=%s">' % encoding, 1)
+            filename = '%s_%03d.html' % (category, n)
+            with open(os.path.join(directory, filename), 'wb') as f:
+                f.write(html.encode(encoding, 'xmlcharrefreplace'))
+            manifest.append({
+                'file': filename,
+                'url': 'http://%s.example.com/%d/' % (category, n),
+                'category': category,
+                'language': language,
+                })
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+def main():
+    args = docopt("""
+usage: corpus.py [-h] [--scale N] DIRECTORY
+
+options:
+    -h, --help              show this message and exit
+    --scale N               multiply number of pages by N [default: 1]
+""")
+    manifest = generate(args['DIRECTORY'], int(args['--scale']))
+    print '%d pages written to %s' % (len(manifest), args['DIRECTORY'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+
+    bench.extraction -- throughput and latency of document extraction
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Extracts every field of :class:`jaws.Document` from pages of generated
+    corpus (see corpus.py) and reports throughput and latency of each field
+    and of each extraction stage as recorded in document's timings. Image
+    sizes are never probed over network, prober is replaced by a stub.
+
+    Results can be saved as a baseline, later runs are compared to it and
+    exit with status 1 if some field or stage got slower than tolerated.
+
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import resource
+
+from docopt import docopt
+
+import justext
+import jaws.image
+from jaws import Document
+from jaws.fetch import detect_encoding
+from jaws.metrics import Timings
+
+import corpus
+
+# in the order they are extracted, time of each field doesn't include
+# stages computed for the preceding ones
+FIELDS = ('title', 'author', 'image', 'text', 'html')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def _stub_image_size(url, fetcher=None):
+    return (640, 480)
+
+def load(directory, scale=1, category=None):
+    """ Return pages of corpus in ``directory``, generating it if missing,
+    along with its digest"""
+    if not os.path.exists(os.path.join(directory, 'manifest.json')):
+        corpus.generate(directory, scale)
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    digest = hashlib.sha1()
+    pages = []
+    for page in manifest:
+        if category and page['category'] != category:
+            continue
+        with open(os.path.join(directory, page['file']), 'rb') as f:
+            data = f.read()
+        digest.update(data)
+        pages.append((page, data))
+    return pages, digest.hexdigest()
+
+def run(pages, repeat):
+    """ Extract all fields from ``pages`` ``repeat`` times
+
+    Returns ``(seconds, bytes)`` samples by row name along with number of
+    failed extractions by field.
+    """
+    samples = {}
+    errors = dict.fromkeys(FIELDS, 0)
+
+    def _sample(name, seconds, size):
+        samples.setdefault(name, []).append((seconds, size))
+
+    for _ in range(repeat):
+        for page, data in pages:
+            started = time.time()
+            timings = Timings()
+            with timings.stage('detect_encoding'):
+                encoding = detect_encoding(data)
+            doc = Document(data, url=page['url'], language=page['language'],
+                encoding=encoding, timings=timings)
+            for field in FIELDS:
+                field_started = time.time()
+                try:
+                    getattr(doc, field)
+                except Exception:
+                    errors[field] += 1
+                _sample('field ' + field, time.time() - field_started,
+                    len(data))
+            _sample('total', time.time() - started, len(data))
+            for name, (wall, cpu) in timings.stages.items():
+                _sample('stage ' + name, wall, len(data))
+    return samples, errors
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[int(round(p / 100.0 * (len(values) - 1)))]
+
+def summarize(samples):
+    rows = {}
+    for name, values in samples.items():
+        seconds = sum(s for s, _ in values)
+        size = sum(b for _, b in values)
+        times = [s for s, _ in values]
+        rows[name] = {
+            'count': len(values),
+            'seconds': seconds,
+            'pages_per_s': len(values) / seconds if seconds else 0,
+            'mb_per_s': size / 1024.0 / 1024.0 / seconds if seconds else 0,
+            'p50_ms': percentile(times, 50) * 1000,
+            'p99_ms': percentile(times, 99) * 1000,
+            }
+    return rows
+
+def _order(rows):
+    fields = ['field ' + field for field in FIELDS]
+    stages = sorted((name for name in rows if name.startswith('stage ')),
+        key=lambda name: -rows[name]['seconds'])
+    return ['total'] + [name for name in fields if name in rows] + stages
+
+def compare(rows, baseline, tolerance):
+    """ Return changes of mean and median time of ``rows`` relative to
+    ``baseline`` by row name, and names of rows slower than ``tolerance``"""
+    changes = {}
+    regressions = []
+    for name, row in rows.items():
+        base = baseline.get(name)
+        if not base or not base['seconds'] or not base['p50_ms']:
+            continue
+        mean = (row['seconds'] / row['count']) / (
+            base['seconds'] / base['count']) - 1
+        median = row['p50_ms'] / base['p50_ms'] - 1
+        changes[name] = (mean, median)
+        if mean > tolerance and median > tolerance:
+            regressions.append(name)
+    return changes, regressions
+
+def report(rows, changes, regressions, out=sys.stdout):
+    out.write('%-28s %9s %8s %9s %9s %8s %8s\n' % (
+        '', 'pages/s', 'MB/s', 'p50 ms', 'p99 ms', 'mean', 'p50'))
+    for name in _order(rows):
+        row = rows[name]
+        change = ''
+        if name in changes:
+            change = '%+7.0f%% %+7.0f%%' % tuple(
+                c * 100 for c in changes[name])
+            if name in regressions:
+                change += '  slower'
+        out.write('%-28s %9.1f %8.2f %9.2f %9.2f %s\n' % (
+            name, row['pages_per_s'], row['mb_per_s'], row['p50_ms'],
+            row['p99_ms'], change))
+
+def main():
+    args = docopt("""
+usage: extraction.py [-h] [options]
+
+options:
+    -h, --help              show this message and exit
+    --corpus DIR            corpus directory, generated if missing, defaults
+                            to corpus/ next to this script
+    --scale N               multiply number of pages of generated corpus by N
+                            [default: 1]
+    --category NAME         only use pages of this category: blog, forum,
+                            table or legacy
+    -n N                    number of runs over the corpus [default: 1]
+    --baseline FILE         baseline to compare with, defaults to
+                            baseline.json next to this script
+    --save                  save results as the new baseline
+    --tolerance PERCENT     report fields and stages which got slower by more
+                            than PERCENT both on average and in median
+                            [default: 20]
+""")
+    directory = args['--corpus'] or os.path.join(HERE, 'corpus')
+    baseline_path = args['--baseline'] or os.path.join(HERE, 'baseline.json')
+    jaws.image.image_size = _stub_image_size
+
+    pages, digest = load(directory, int(args['--scale']), args['--category'])
+    if not pages:
+        sys.exit('no pages in %s' % directory)
+    justext.preload_stoplists(set(page['language'] for page, _ in pages))
+    size = sum(len(data) for _, data in pages)
+    print '%d pages, %.1f MB, %d runs' % (
+        len(pages), size / 1024.0 / 1024.0, int(args['-n']))
+
+    samples, errors = run(pages, int(args['-n']))
+    rows = summarize(samples)
+    # kilobytes on Linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+    baseline = None
+    if not args['--save'] and os.path.exists(baseline_path):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        if baseline['corpus'] != digest:
+            print 'warning: baseline was measured on a different corpus'
+    changes, regressions = compare(rows, baseline['rows'] if baseline else {},
+        float(args['--tolerance']) / 100)
+
+    report(rows, changes, regressions)
+    print 'peak RSS %.1f MB%s' % (peak_rss, ' (baseline %.1f MB)' % (
+        baseline['peak_rss_mb']) if baseline else '')
+    for field in FIELDS:
+        if errors[field]:
+            print '%s failed on %d pages' % (field, errors[field])
+
+    if args['--save']:
+        with open(baseline_path, 'w') as f:
+            json.dump({'corpus': digest, 'rows': rows,
+                'peak_rss_mb': peak_rss}, f, indent=1, sort_keys=True)
+        print 'baseline saved to %s' % baseline_path
+    elif regressions:
+        sys.exit('%d fields or stages got slower: %s' % (
+            len(regressions), ', '.join(regressions)))
+
+if __name__ == '__main__':
+    main()
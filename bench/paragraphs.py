@@ -0,0 +1,69 @@
+"""
+
+    bench.paragraphs -- compare justext paragraph makers
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import time
+from copy import deepcopy
+
+from docopt import docopt
+import lxml.html
+
+import justext.core
+
+def load(filenames):
+    """ Parse and preprocess pages the same way justext does"""
+    trees = []
+    for filename in filenames:
+        with open(filename) as f:
+            root = lxml.html.fromstring(f.read())
+        justext.core.remove_comments(root)
+        justext.core.remove_non_content(root)
+        trees.append(root)
+    return trees
+
+def measure(trees, repeat, **kwargs):
+    best = None
+    for _ in range(repeat):
+        started = time.time()
+        for root in trees:
+            justext.core.make_paragraphs(root, **kwargs)
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    args = docopt("""
+usage: paragraphs.py [-h] [-n N] FILE...
+
+options:
+    -h, --help              show this message and exit
+    -n N                    number of runs, best one is reported [default: 5]
+""")
+    trees = load(args['FILE'])
+    repeat = int(args['-n'])
+
+    for root in trees:
+        sax = justext.core.make_paragraphs(deepcopy(root), sax=True)
+        walk = justext.core.make_paragraphs(deepcopy(root), sax=False)
+        if map(dict, sax) != map(dict, walk):
+            raise AssertionError('paragraph makers disagree')
+
+    size = sum(len(lxml.html.tostring(root)) for root in trees)
+    print '%d pages, %.1f MB after preprocessing' % (
+        len(trees), size / 1024.0 / 1024.0)
+    baseline = None
+    for label, kwargs in (
+            ('sax, xpaths', dict(sax=True, xpaths=True)),
+            ('sax', dict(sax=True, xpaths=False)),
+            ('tree walk, xpaths', dict(sax=False, xpaths=True)),
+            ('tree walk', dict(sax=False, xpaths=False))):
+        elapsed = measure(trees, repeat, **kwargs)
+        baseline = baseline or elapsed
+        print '%-20s %8.3fs %8.1f pages/s %6.2fx' % (
+            label, elapsed, len(trees) / elapsed, baseline / elapsed)
+
+if __name__ == '__main__':
+    main()
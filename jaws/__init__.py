@@ -5,24 +5,26 @@
 
 """
 
-import re
+import os
+import sys
+import urllib
+import urlparse
 from copy import deepcopy
-from urllib2 import Request as URLRequest, build_opener, HTTPCookieProcessor
-from cookielib import CookieJar
-from contextlib import closing
 from cStringIO import StringIO
 
 from docopt import docopt
-from chardet import detect
 import lxml.html
-import lxml.html.clean
 
 import justext
 import justext.core
 
-from .utils import gen_matches_any, matches_attr, zn2
+from .utils import zn2
 from .author import extract_author
-from .image import extract_cover_image
+from .image import extract_cover_image, extract_meta_image
+from .cleanup import cleanup
+from .fetch import Fetcher, fetch_many, detect_encoding
+from .metadata import parse_metadata
+from .metrics import Timings
 
 __all__ = ('Document',)
 
@@ -40,64 +42,135 @@ class cached_property(object):
         return val
 
 class Document(object):
-    """ Document extraction API"""
+    """ Document extraction API
 
-    def __init__(self, data, url=None, language='English'):
+    Time spent in each stage of extraction is recorded in ``timings``, a
+    :class:`jaws.metrics.Timings`.
+    """
+
+    def __init__(self, data, url=None, language='English', encoding=None,
+            timings=None):
         self.data = data
         self.url = url
         self.language = language
+        self.encoding = encoding
+        self.timings = Timings() if timings is None else timings
 
     @classmethod
-    def from_url(cls, url):
+    def from_url(cls, url, fetcher=None):
         """ Create document by fetching ``url``"""
-        data = fetch_url(url)
-        return cls(data, url=url)
+        timings = Timings()
+        with timings.stage('fetch'):
+            fetched = (fetcher or _fetcher).fetch(url)
+        return cls(fetched.data, url=url, encoding=fetched.encoding,
+            timings=timings)
+
+    @classmethod
+    def from_urls(cls, urls, concurrency=8, fetcher=None):
+        """ Create documents by fetching ``urls`` concurrently
+
+        Yields ``(url, document)`` pairs in order of completion, ``document``
+        is an exception instance if ``url`` couldn't be fetched.
+        """
+        return fetch_many(urls, lambda url: cls.from_url(url, fetcher=fetcher),
+            concurrency=concurrency)
 
     @classmethod
-    def from_file(cls, filename):
-        with open(filename) as f:
-            return cls(f.read())
+    def from_record(cls, record):
+        """ Create document from :class:`jaws.warc.Record` read from an
+        archive"""
+        return cls(record.payload, url=record.url,
+            encoding=detect_encoding(record.payload, record.charset))
+
+    @classmethod
+    def from_file(cls, filename, url=None, encoding=None):
+        """ Create document from file at ``filename``
+
+        File is memory mapped rather than read into memory and fed to the
+        parser in chunks. ``url`` is resolved against file URL of the file,
+        which is used itself if ``url`` is None, so relative image URLs
+        resolve to files next to it.
+        """
+        base = 'file://' + urllib.pathname2url(os.path.abspath(filename))
+        url = urlparse.urljoin(base, url) if url else base
+        return cls(justext.core.map_file(filename), url=url,
+            encoding=encoding)
 
     @cached_property
     def parsed(self):
         """ Parsed document"""
-        return lxml.html.fromstring(self.data)
+        data = self.data
+        with self.timings.stage('parse'):
+            if not self.encoding:
+                parser = lxml.html.HTMLParser()
+            else:
+                try:
+                    parser = lxml.html.HTMLParser(encoding=self.encoding)
+                except LookupError:
+                    # encoding isn't supported by libxml2, let Python decode
+                    # it
+                    data = data[:].decode(self.encoding, 'replace').encode(
+                        'utf8')
+                    parser = lxml.html.HTMLParser(encoding='utf-8')
+            if not isinstance(data, basestring):
+                # memory mapped file
+                doc = justext.core.feed_parser(parser, data)
+            else:
+                doc = lxml.html.fromstring(data, parser=parser)
+        self.timings.sizes['bytes'] = len(self.data)
+        # counted by libxml2 without creating Python proxies of elements
+        self.timings.sizes['elements'] = int(doc.xpath('count(//*)'))
+        return doc
+
+    @cached_property
+    def metadata(self):
+        """ Metadata from document's <head>, parsed without building a tree"""
+        with self.timings.stage('metadata'):
+            return parse_metadata(self.data, encoding=self.encoding)
 
     def analyse_paragraphs(self, doc):
-        return justext.justext(doc, justext.get_stoplist(self.language))
+        return justext.justext(doc, justext.get_stoplist(self.language),
+            xpaths=False, sax=False, stage=self.timings.stage)
+
+    @cached_property
+    def analysed(self):
+        """ Preprocessed document and its classified paragraphs
+
+        Computed once and shared between content and image extraction, the
+        tree must be treated as read-only by consumers.
+        """
+        parsed = self.parsed
+        with self.timings.stage('copy'):
+            doc = deepcopy(parsed)
+        paragraphs = self.analyse_paragraphs(doc)
+        self.timings.sizes['paragraphs'] = len(paragraphs)
+        return doc, paragraphs
 
     @cached_property
     def clean_doc(self):
         """ Extracted HTML content"""
-        doc = deepcopy(self.parsed)
-        paragraphs = self.analyse_paragraphs(doc)
-        process_paragraphs(doc, paragraphs)
-
-        remove_bad_attrs(doc)
-        remove_tail(doc)
-
-        cleaner = lxml.html.clean.Cleaner(
-            scripts=True,
-            javascript=True,
-            style=True,
-            links=True,
-            meta=True,
-            page_structure=True,
-            forms=True,
-            remove_tags=['font'],
-            )
-        cleaner(doc)
-        garden(doc)
+        analysed, paragraphs = self.analysed
+        stage = self.timings.stage
+        with stage('copy'):
+            doc = deepcopy(analysed)
+        with stage('process_paragraphs'):
+            process_paragraphs(doc, paragraphs)
+
+        cleanup(doc, stage=stage)
         return doc
 
     @cached_property
     def html(self):
-        return lxml.html.tostring(self.clean_doc, pretty_print=True)
+        doc = self.clean_doc
+        with self.timings.stage('serialize'):
+            return lxml.html.tostring(doc, pretty_print=True)
 
     @cached_property
     def text(self):
         """ Extracted text"""
-        return self.clean_doc.text_content().strip()
+        doc = self.clean_doc
+        with self.timings.stage('text'):
+            return doc.text_content().strip()
 
     @cached_property
     def title(self):
@@ -136,187 +209,73 @@ class Document(object):
                 return found[0][0]
             return title.strip()
 
-        for finder in (_find_meta_title, _find_og_meta_title, _find_title):
-            title = finder(doc)
-            if title:
-                return _clean(title, doc)
+        with self.timings.stage('title'):
+            for finder in (_find_meta_title, _find_og_meta_title, _find_title):
+                title = finder(doc)
+                if title:
+                    return _clean(title, doc)
 
     @cached_property
     def author(self):
-        return extract_author(deepcopy(self.parsed))
+        doc = self.parsed
+        with self.timings.stage('author'):
+            return extract_author(doc)
 
     @cached_property
     def image(self):
         assert self.url is not None
-        doc = deepcopy(self.parsed)
-        paragraphs = self.analyse_paragraphs(doc)
-        return extract_cover_image(doc, self.url, paragraphs=paragraphs)
-
-def bottom_up_traverse(root):
-    for e in root:
-        if len(e) > 0:
-            for x in bottom_up_traverse(e):
-                yield x
-        yield e
-
-def is_good(e):
-    return (
-        e.attrib.get('good')
-        or e.xpath('*[@good="true"]'))
-
-def remove_tail(root):
-    e = root.xpath('//*[@good="true"]')
-    if not e:
-        return
-    e = e[-1]
-
-    while e.getparent() is not None:
-        cur = e
-        while cur.getnext() is not None:
-            next = e.getnext()
-            if not is_good(next):
-                next.drop_tree()
-            cur = next
-        e = e.getparent()
-
-def garden(root):
-    # normalize text content
-    for el in list(root.iter()):
-        for attr in ('class', 'id'):
-            if attr in el.attrib:
-                el.attrib.pop(attr)
-        if el.text and re.search('[a-zA-Z]', el.text):
-            el.text = re.sub('[\t\n\r]+', ' ', el.text)
-            el.text = re.sub('[ ]+', ' ', el.text)
-        else:
-            el.text = None
-
-        if el.tail and re.search('[a-zA-Z]', el.tail):
-            el.tail = re.sub('[\t\n\r]+', ' ', el.tail)
-            el.tail = re.sub('[ ]+', ' ', el.tail)
-        else:
-            el.tail = None
-
-    for el in list(bottom_up_traverse(root)):
-        # remove all elems which have no content
-        if (len(el) == 0
-                and el.tag not in ('img',)
-                and not el.text
-                and el.getparent() is not None):
-            el.drop_tree()
-
-        # unwrap elements which only do
-        if (len(el) == 1
-                and not el.text
-                and el.getparent() is not None):
-            el.drop_tag()
+        # justext drops <head> from the analysed tree, look for <meta> images
+        # in document's metadata
+        metadata = self.metadata
+        with self.timings.stage('image'):
+            image = extract_meta_image(metadata, self.url)
+        if image:
+            return image
+        doc, paragraphs = self.analysed
+        with self.timings.stage('image'):
+            return extract_cover_image(doc, self.url, paragraphs=paragraphs)
 
 def process_paragraphs(root, paragraphs):
     """ Remove nodes which were classified as "bad" by justext algo"""
+    elements = justext.list_elements(root)
     to_delete = []
     for p in paragraphs:
+        if p['node'] is None:
+            continue
         if p['class'] == 'bad':
-            to_delete.extend(root.xpath(p['xpath']))
+            to_delete.append(elements[p['node']])
         elif p['class'] == 'good':
-            for e in root.xpath(p['xpath']):
-                e.attrib['good'] = 'true'
+            elements[p['node']].attrib['good'] = 'true'
     for el in reversed(to_delete):
         if el.getparent() is not None:
             el.drop_tree()
 
-def remove_bad_attrs(root):
-    """ Remove nodes which have "bad" class or id attributes"""
-    for el in list(bottom_up_traverse(root)):
-        if matches_attr(_very_bad_attr_re, el, 'class', 'id'):
-            el.drop_tree()
-        elif (
-            matches_attr(_bad_attr_re, el, 'class', 'id')
-            and not any(
-                matches_attr(_good_attr_re, x, 'class', 'id')
-                for x in el.iter())):
-
-            el.drop_tree()
-
 def output(result, formatter):
     fp = StringIO()
     formatter(result, fp=fp)
     fp.seek(0, 0)
     return fp.read()
 
-def fetch_url(url):
-    """ Fetch URL using sane UA and encoding processing"""
-    request = URLRequest(url, None, {
-        'User-Agent': (
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8)'
-            'AppleWebKit/536.25 (KHTML, like Gecko)'
-            'Version/6.0 Safari/536.25')
-        })
-    opener = build_opener(HTTPCookieProcessor(CookieJar()))
-    with closing(opener.open(request)):
-        data = opener.open(request).read()
-    enc = detect(data).get('encoding')
-    if enc:
-        data = data.decode(enc).encode('utf8')
-    return data
+_fetcher = Fetcher()
+
+def fetch_url(url, fetcher=None):
+    """ Fetch URL using sane UA and encoding processing
 
-_very_bad_attr_re = gen_matches_any(
-    'comment',
-    'discuss',
-    )
-_bad_attr_re = gen_matches_any(
-    'sidebar',
-    'tweet',
-    'header',
-    'contact',
-    'login',
-    'foot',
-    'popup',
-    'promo',
-    'combx',
-    'com-',
-    'masthead',
-    '^media$',
-    'meta',
-    'outbrain',
-    'related',
-    'scroll',
-    'shoutbox',
-    'sponsor',
-    'shopping',
-    'tags',
-    'tool',
-    'widget',
-    'print',
-    'taxonom',
-    'e[\-]?mail',
-    'share',
-    'reply',
-    'sign',
-    'caption',
-    'ad-',
-    'subscri',
-    'buy',
-    '(^|\-|_)date($|\-|_)',
-    )
-
-_good_attr_re = gen_matches_any(
-    'article',
-    'body',
-    'content',
-    'entry',
-    'hentry',
-    'main',
-    'page',
-    'pagination',
-    'post',
-    'text',
-    'blog',
-    'story',
-    )
+    Connections are reused between calls, pass ``fetcher`` to configure
+    timeouts and size limits.
+    """
+    fetched = (fetcher or _fetcher).fetch(url)
+    data = fetched.data
+    if fetched.encoding:
+        data = data.decode(fetched.encoding, 'replace').encode('utf8')
+    return data
 
 def main():
     args = docopt("""
-usage: jaws [-h] (--html | --text | --title | --image) URL
+usage:
+    jaws [-h] (--html | --text | --title | --author | --image) URL
+    jaws [-h] --batch [options] [INPUT]
+    jaws [-h] --warc [options] ARCHIVE...
 
 options:
     -h, --help              show this message and exit
@@ -326,8 +285,29 @@ options:
     --title                 title
     -a, --author            author
     -i, --image             image
+
+    --batch                 extract from URLs or files listed in INPUT (or
+                            stdin) one per line, write JSON lines to stdout
+    -f, --fields FIELDS     comma separated fields to extract in batch mode
+                            [default: title,author,image,text]
+    -j, --jobs N            number of worker processes, defaults to number
+                            of CPUs
+    --ordered               write results in input order rather than in
+                            order of completion
+    --checkpoint FILE       record inputs extracted without errors in FILE
+                            and skip them when restarted
+
+    --warc                  extract from HTML responses stored in WARC or
+                            ARC files (possibly gzipped) like in batch mode
+    --content-type TYPES    comma separated content types of records to
+                            extract from
+                            [default: text/html,application/xhtml+xml]
+    --url-pattern REGEX     only extract from records with matching URLs
 """)
 
+    if args['--batch'] or args['--warc']:
+        return _main_batch(args)
+
     url = args['URL']
     if url.lower().startswith('http'):
         doc = Document.from_url(url)
@@ -343,3 +323,27 @@ options:
         print doc.image
     else:
         print doc.html
+
+def _main_batch(args):
+    from .batch import run_batch, FIELDS
+    from .warc import iter_records
+    fields = tuple(f.strip() for f in args['--fields'].split(',') if f.strip())
+    for field in fields:
+        if field not in FIELDS:
+            raise SystemExit('unknown field: %s' % field)
+    if args['--warc']:
+        content_types = tuple(
+            t.strip() for t in args['--content-type'].split(','))
+        sources = iter_records(args['ARCHIVE'], content_types=content_types,
+            url_pattern=args['--url-pattern'])
+    elif args['INPUT']:
+        sources = open(args['INPUT'])
+    else:
+        sources = sys.stdin
+    try:
+        run_batch(sources, fields,
+            processes=int(args['--jobs']) if args['--jobs'] else None,
+            ordered=args['--ordered'],
+            checkpoint=args['--checkpoint'])
+    finally:
+        sources.close()
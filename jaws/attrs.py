@@ -0,0 +1,104 @@
+"""
+
+    jaws.attrs -- classification of elements by class and id
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+from .utils import AttrClassifier
+
+__all__ = ('VERY_BAD', 'BAD', 'GOOD', 'AUTHOR', 'AUTHOR_BANNED', 'COMMENT',
+    'classify')
+
+# boilerplate, dropped with whatever they contain
+VERY_BAD = 1
+# boilerplate, dropped unless they contain good elements
+BAD = 2
+# content
+GOOD = 4
+# authorship
+AUTHOR = 8
+# not authorship even if they look like it
+AUTHOR_BANNED = 16
+# comments, authors there aren't authors of the document
+COMMENT = 32
+
+_families = [
+    (VERY_BAD, (
+        'comment',
+        'discuss',
+        )),
+    (BAD, (
+        'sidebar',
+        'tweet',
+        'header',
+        'contact',
+        'login',
+        'foot',
+        'popup',
+        'promo',
+        'combx',
+        'com-',
+        'masthead',
+        '^media$',
+        'meta',
+        'outbrain',
+        'related',
+        'scroll',
+        'shoutbox',
+        'sponsor',
+        'shopping',
+        'tags',
+        'tool',
+        'widget',
+        'print',
+        'taxonom',
+        'e[\-]?mail',
+        'share',
+        'reply',
+        'sign',
+        'caption',
+        'ad-',
+        'subscri',
+        'buy',
+        '(^|\-|_)date($|\-|_)',
+        )),
+    (GOOD, (
+        'article',
+        'body',
+        'content',
+        'entry',
+        'hentry',
+        'main',
+        'page',
+        'pagination',
+        'post',
+        'text',
+        'blog',
+        'story',
+        )),
+    (AUTHOR, (
+        'contributor',
+        'author',
+        'writer',
+        'byline',
+        'by$',
+        'signoff',
+        'name',
+        )),
+    (AUTHOR_BANNED, (
+        'date',
+        'photo',
+        'title',
+        'tag',
+        )),
+    (COMMENT, (
+        'comment', 'discus', 'disqus', 'pingback',
+        )),
+    ]
+
+_classifier = AttrClassifier(_families)
+
+def classify(e):
+    """ Return mask of classes of element ``e`` by its class and id"""
+    return _classifier.classify(e)
@@ -7,7 +7,8 @@
 
 import re
 import lxml.html
-from .utils import gen_matches_any, matches_attr, depth_first
+from . import attrs
+from .utils import depth_first
 from .utils import try_parse_timestamp
 
 __all__ = ('extract_author',)
@@ -72,7 +73,7 @@ def extract_author(doc):
         seen = []
 
         # if we encounter comments - skip entire subtree
-        skip = lambda e: matches_attr(_comment_classes, e, 'class', 'id')
+        skip = lambda e: attrs.classify(e) & attrs.COMMENT
         for e in depth_first(doc, skip=skip):
             weight = 0
             text = e.text_content().strip()
@@ -85,9 +86,10 @@ def extract_author(doc):
                 weight += 1
 
             # try to match by class and id names
+            classes = attrs.classify(e)
             if (
-                matches_attr(_author_classes, e, 'class', 'id')
-                and not matches_attr(_author_classes_banned, e, 'class', 'id')):
+                classes & attrs.AUTHOR
+                and not classes & attrs.AUTHOR_BANNED):
                 if not text:
                     continue
                 weight += 1
@@ -145,26 +147,6 @@ def extract_author(doc):
             if maybe_author:
                 return maybe_author
 
-_author_classes = gen_matches_any(
-    'contributor',
-    'author',
-    'writer',
-    'byline',
-    'by$',
-    'signoff',
-    'name',
-    )
-
-_author_classes_banned = gen_matches_any(
-    'date',
-    'photo',
-    'title',
-    'tag',
-    )
-
-_comment_classes = gen_matches_any(
-    'comment', 'discus', 'disqus', 'pingback')
-
 _author_content = re.compile(
     r'^[^a-z]*(posted)|(written)|(publsihed)|(created)\s?by\s?.+', re.I | re.VERBOSE)
 
@@ -0,0 +1,134 @@
+"""
+
+    jaws.batch -- extraction from many documents using a pool of processes
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import sys
+import time
+import json
+import threading
+import multiprocessing
+
+import justext
+
+from . import Document
+from .warc import Record
+
+__all__ = ('extract', 'run_batch', 'FIELDS')
+
+FIELDS = ('html', 'text', 'title', 'author', 'image')
+
+# number of inputs handed to a worker at once
+CHUNK_SIZE = 4
+
+def _init_worker(language):
+    justext.preload_stoplists([language])
+
+def extract(item):
+    """ Extract fields from document, ``item`` is ``(source, fields)`` pair,
+    where ``source`` is an URL, a filename or an archived
+    :class:`jaws.warc.Record`
+
+    Returns a dict with ``source`` (record's URL) under "input" key and
+    extracted fields or an error description under "error" key.
+    """
+    (source, fields) = item
+    result = {'input': _key(source)}
+    started = time.time()
+    try:
+        if isinstance(source, Record):
+            doc = Document.from_record(source)
+        elif source.lower().startswith('http'):
+            doc = Document.from_url(source)
+        else:
+            doc = Document.from_file(source)
+        result['size'] = len(doc.data)
+        for field in fields:
+            result[field] = getattr(doc, field)
+    except Exception as e:
+        result['error'] = '%s: %s' % (e.__class__.__name__, e)
+    result['elapsed'] = time.time() - started
+    return result
+
+def _key(source):
+    return source.url if isinstance(source, Record) else source
+
+def _read_checkpoint(checkpoint):
+    try:
+        with open(checkpoint) as f:
+            return set(line.rstrip('\n') for line in f)
+    except IOError:
+        return set()
+
+def run_batch(sources, fields, out=sys.stdout, processes=None,
+        ordered=False, checkpoint=None, language='English', log=sys.stderr):
+    """ Extract ``fields`` from documents at ``sources`` writing results as
+    JSON lines to ``out``, ``sources`` are URLs, filenames or archived
+    :class:`jaws.warc.Record` objects
+
+    :param ordered:
+        write results in order of ``sources`` rather than as they complete
+    :param checkpoint:
+        file which records sources done without errors, they are skipped when
+        batch is run again while failed ones are retried
+    :param log:
+        file to write throughput summary to
+    """
+    done = _read_checkpoint(checkpoint) if checkpoint else set()
+    processes = processes or multiprocessing.cpu_count()
+    # keep number of sources in flight bounded so that huge inputs aren't
+    # read into memory at once
+    window = threading.Semaphore(processes * CHUNK_SIZE * 4)
+    # lets the pool's thread feeding inputs, which may be waiting for the
+    # window, finish once results are no longer consumed
+    stopped = threading.Event()
+    skipped = [0]
+
+    def _items():
+        for source in sources:
+            if not isinstance(source, Record):
+                source = source.strip()
+                if not source:
+                    continue
+            if _key(source) in done:
+                skipped[0] += 1
+                continue
+            window.acquire()
+            if stopped.is_set():
+                return
+            yield (source, fields)
+
+    pool = multiprocessing.Pool(processes, _init_worker, (language,))
+    imap = pool.imap if ordered else pool.imap_unordered
+    checkpoint_file = open(checkpoint, 'a') if checkpoint else None
+    count = errors = size = 0
+    started = time.time()
+    try:
+        for result in imap(extract, _items(), CHUNK_SIZE):
+            window.release()
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+            if checkpoint_file and 'error' not in result:
+                checkpoint_file.write(result['input'] + '\n')
+                checkpoint_file.flush()
+            count += 1
+            errors += 'error' in result
+            size += result.get('size', 0)
+        pool.close()
+    finally:
+        stopped.set()
+        window.release()
+        pool.terminate()
+        if checkpoint_file:
+            checkpoint_file.close()
+    elapsed = time.time() - started
+    if log:
+        log.write(
+            '%d documents (%d failed, %d skipped) in %.1fs:'
+            ' %.1f documents/s, %.2f MB/s\n' % (
+                count, errors, skipped[0], elapsed,
+                count / elapsed if elapsed else 0,
+                size / 1024.0 / 1024.0 / elapsed if elapsed else 0))
+    return count, errors
@@ -0,0 +1,339 @@
+"""
+
+    jaws.cache -- in-process and on-disk caches
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import os
+import sys
+import time
+import errno
+import fcntl
+import hashlib
+import itertools
+import threading
+import sqlite3
+import cPickle as pickle
+from collections import OrderedDict
+from contextlib import contextmanager
+
+__all__ = ('LRUCache', 'SQLiteCache', 'TieredCache', 'SingleFlight')
+
+# writes to SQLiteCache between purges of expired and excess entries
+PURGE_EVERY = 1000
+
+class _Cache(object):
+    """ Base for caches, subclasses implement ``get_entry``, ``set_entry``,
+    ``delete`` and ``clear``"""
+
+    ttl = None
+    hits = 0
+    misses = 0
+
+    def get(self, key, default=None):
+        """ Return value for ``key`` or ``default`` if it's missing or
+        expired"""
+        entry = self.get_entry(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        """ Store ``value`` for ``key`` for ``ttl`` seconds, cache's default
+        TTL is used if it's None"""
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.time() + ttl
+        self.set_entry(key, value, expires)
+
+    def stats(self):
+        """ Return hit and miss counters"""
+        return {'hits': self.hits, 'misses': self.misses}
+
+class LRUCache(_Cache):
+    """ Thread-safe in-process cache which evicts least recently used entries
+
+    :param maxsize:
+        maximum number of entries
+    :param ttl:
+        default number of seconds entries are kept for, None means forever
+    :param max_bytes:
+        maximum total size of values as measured by ``sizeof``
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, max_bytes=None, sizeof=len):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_entry(self, key):
+        """ Return ``(expires, value)`` for ``key`` or None"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            (expires, value, size) = entry
+            if expires is not None and expires <= time.time():
+                self.size -= size
+                return None
+            self._entries[key] = entry
+            return (expires, value)
+
+    def set_entry(self, key, value, expires):
+        size = self.sizeof(value) if self.max_bytes else 0
+        if self.max_bytes and size > self.max_bytes:
+            self.delete(key)
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (expires, value, size)
+            self.size += size
+            while (len(self._entries) > self.maxsize
+                    or self.max_bytes and self.size > self.max_bytes):
+                self.size -= self._entries.popitem(last=False)[1][2]
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+class SQLiteCache(_Cache):
+    """ Cache stored in SQLite database at ``path``
+
+    Database can be shared by several processes, errors from it are treated
+    as cache misses and failed changes are ignored. It's purged on the first
+    write of each process and every ``purge_every`` writes after.
+
+    :param ttl:
+        default number of seconds entries are kept for, None means forever
+    :param max_entries:
+        maximum number of entries kept by purges, those expiring first and
+        then oldest ones are evicted
+    """
+
+    def __init__(self, path, ttl=None, timeout=1, max_entries=None,
+            purge_every=PURGE_EVERY):
+        self.path = path
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.purge_every = purge_every
+        self._writes = itertools.count()
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        # sqlite connections can't be shared between threads nor survive fork
+        if getattr(self._local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.timeout)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache'
+                ' (key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+            db.execute(
+                'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+            db.commit()
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return self._local.db
+
+    def get_entry(self, key):
+        """ Return ``(expires, value)`` for ``key`` or None"""
+        try:
+            row = self._db.execute(
+                'SELECT expires, value FROM cache'
+                ' WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time())).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return (row[0], pickle.loads(str(row[1])))
+
+    def set_entry(self, key, value, expires):
+        data = sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        try:
+            with self._db as db:
+                db.execute(
+                    'INSERT OR REPLACE INTO cache (key, value, expires)'
+                    ' VALUES (?, ?, ?)', (key, data, expires))
+        except sqlite3.Error:
+            pass
+        if next(self._writes) % self.purge_every == 0:
+            self.purge()
+
+    def delete(self, key):
+        self._execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._execute('DELETE FROM cache')
+
+    def purge(self):
+        """ Remove expired entries and those over ``max_entries``"""
+        try:
+            with self._db as db:
+                db.execute(
+                    'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+                if self.max_entries is None:
+                    return
+                (count,) = db.execute('SELECT COUNT(*) FROM cache').fetchone()
+                if count <= self.max_entries:
+                    return
+                # replaced entries get a new rowid, so it's insertion order
+                db.execute(
+                    'DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache'
+                    ' ORDER BY expires IS NULL, expires, rowid LIMIT ?)',
+                    (count - self.max_entries,))
+        except sqlite3.Error:
+            pass
+
+    def _execute(self, sql, params=()):
+        try:
+            with self._db as db:
+                db.execute(sql, params)
+        except sqlite3.Error:
+            pass
+
+class TieredCache(_Cache):
+    """ Cache which looks up ``tiers`` in order, filling faster tiers with
+    entries found in slower ones"""
+
+    def __init__(self, *tiers):
+        self.tiers = tiers
+
+    def get_entry(self, key):
+        """ Return ``(expires, value)`` for ``key`` or None"""
+        for n, tier in enumerate(self.tiers):
+            entry = tier.get_entry(key)
+            if entry is None:
+                tier.misses += 1
+            else:
+                tier.hits += 1
+                for faster in self.tiers[:n]:
+                    faster.set_entry(key, entry[1], entry[0])
+                return entry
+
+    def set(self, key, value, ttl=None):
+        for tier in self.tiers:
+            tier.set(key, value, ttl=ttl)
+
+    def set_entry(self, key, value, expires):
+        for tier in self.tiers:
+            tier.set_entry(key, value, expires)
+
+    def delete(self, key):
+        for tier in self.tiers:
+            tier.delete(key)
+
+    def clear(self):
+        for tier in self.tiers:
+            tier.clear()
+
+    def stats(self):
+        stats = _Cache.stats(self)
+        stats['tiers'] = [tier.stats() for tier in self.tiers]
+        return stats
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+    def wait(self):
+        self.done.wait()
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+class SingleFlight(object):
+    """ Lets concurrent calls for the same key share a single call
+
+    :param lock_path:
+        prefix of lock files coordinating calls of several processes, when
+        one of them is in a call for a key others wait for it to finish
+        before making their own call, which is expected to find its result
+        in a cache shared by them; if it wasn't stored, their calls go on
+        at once rather than waiting for each other in turn
+    """
+
+    # keys are spread over this many lock files, calls for keys sharing one
+    # just wait for each other
+    lock_files = 256
+
+    def __init__(self, lock_path=None):
+        self.lock_path = lock_path
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args, **kwargs):
+        """ Return result of ``func(*args, **kwargs)``, or of the call for
+        ``key`` already in progress"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+        if not leader:
+            return call.wait()
+        try:
+            with self._locked(key):
+                call.result = func(*args, **kwargs)
+        except:
+            call.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    @contextmanager
+    def _locked(self, key):
+        if not self.lock_path:
+            yield
+            return
+        # flock() locks belong to the open file rather than to the process
+        # as lockf() ones do, so threads of a process holding a lock each
+        # don't trip kernel's deadlock detection, and a file opened per call
+        # can't be unlocked by a call for another key
+        n = int(hashlib.sha1(key).hexdigest()[:8], 16) % self.lock_files
+        with open('%s.%d' % (self.lock_path, n), 'a') as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                leader = True
+            except IOError as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+                leader = False
+            if not leader:
+                # only wait for the call in progress, the lock isn't kept
+                fcntl.flock(f, fcntl.LOCK_EX)
+                fcntl.flock(f, fcntl.LOCK_UN)
+                yield
+                return
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
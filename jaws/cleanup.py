@@ -0,0 +1,201 @@
+"""
+
+    jaws.cleanup -- cleanup of extracted content
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Removes boilerplate left after justext, strips unsafe tags and
+    attributes and normalizes whitespace. This is what ``remove_bad_attrs``,
+    ``remove_tail``, :class:`lxml.html.clean.Cleaner` (scripts, javascript,
+    style, links, meta, page structure and forms, ``<font>`` removed) and
+    ``garden`` did one after another, done in a couple of linear passes with
+    the same result.
+
+"""
+
+import re
+
+import lxml.etree
+import lxml.html.clean
+from lxml.html import defs
+
+from justext.core import _no_stage
+
+from . import attrs
+
+__all__ = ('cleanup',)
+
+# dropped with their content
+_kill_tags = frozenset([
+    'script', 'style', 'link', 'meta', 'applet',
+    'button', 'input', 'select', 'textarea',
+    lxml.etree.Comment, lxml.etree.ProcessingInstruction,
+    ]) | defs.frame_tags
+# unwrapped, as are tags unknown to HTML
+_remove_tags = frozenset([
+    'head', 'html', 'title', 'iframe', 'embed', 'layer', 'object', 'param',
+    'form', 'blink', 'marquee', 'font',
+    ])
+# class and id are only needed to find boilerplate, "good" marks content
+# until the tail is removed
+_keep_attrs = (defs.safe_attrs - set(['class', 'id'])) | set(['good'])
+_link_attrs = defs.link_attrs & defs.safe_attrs
+_remove_javascript_link = lxml.html.clean.Cleaner()._remove_javascript_link
+
+# flags of elements in the side table built by _remove_bad_attrs
+_GOOD_ATTR = 1      # element or one of its descendants has a good class or id
+_GOOD_CHILD = 2     # one of its children is marked good by justext
+
+_letter_re = re.compile('[a-zA-Z]')
+_space_re = re.compile('[\t\n\r ]+')
+
+def cleanup(root, stage=None):
+    """ Clean up content of ``root`` in place
+
+    :param stage:
+        context manager factory, e.g. :meth:`jaws.metrics.Timings.stage`,
+        each pass is run within ``stage(name)``
+    """
+    stage = stage or _no_stage
+    with stage('remove_bad_attrs'):
+        kill, remove, marked, index = _remove_bad_attrs(root)
+    with stage('remove_tail'):
+        _remove_tail(root, marked, index)
+    with stage('clean'):
+        _clean(root, kill, remove)
+    with stage('garden'):
+        _garden(root)
+
+def _remove_bad_attrs(root):
+    """ Drop elements with bad class or id, sanitize attributes of the rest
+
+    Returns elements to be dropped and unwrapped by :func:`_clean`, which
+    can't be done before the tail is removed, elements marked good in
+    reversed document order and a side table of flags by element.
+    """
+    kill = []
+    remove = []
+    marked = []
+    index = {}
+    elements = list(root.iter())
+    # children come before their parents in reversed document order
+    for el in reversed(elements):
+        tag = el.tag
+        names = el.keys()
+        if el is not root:
+            good = index.get(el, 0) & _GOOD_ATTR
+            if 'class' in names or 'id' in names:
+                classes = attrs.classify(el)
+                if classes & attrs.VERY_BAD:
+                    el.drop_tree()
+                    continue
+                good = good or classes & attrs.GOOD
+                if not good and classes & attrs.BAD:
+                    el.drop_tree()
+                    continue
+            parent = el.getparent()
+            if good:
+                index[parent] = index.get(parent, 0) | _GOOD_ATTR
+            if el.get('good') == 'true':
+                index[parent] = index.get(parent, 0) | _GOOD_CHILD
+                marked.append(el)
+
+        if tag == 'image':
+            el.tag = tag = 'img'
+        for name in names:
+            if name not in _keep_attrs:
+                del el.attrib[name]
+            elif name in _link_attrs:
+                value = el.get(name)
+                link = _remove_javascript_link(value.strip())
+                if link != value:
+                    el.set(name, link)
+
+        if tag in _kill_tags or (tag == 'param' and not _embedded(el)):
+            kill.append(el)
+        elif tag in _remove_tags or tag not in defs.tags:
+            remove.append(el)
+    return kill, remove, marked, index
+
+def _embedded(el):
+    for parent in el.iterancestors():
+        if parent.tag in ('applet', 'object'):
+            return True
+    return False
+
+def _remove_tail(root, marked, index):
+    # the last element marked good which wasn't dropped since
+    for e in marked:
+        if _attached(e, root):
+            break
+    else:
+        return
+
+    # only the first following sibling on each level is dropped
+    while e.getparent() is not None:
+        next = e.getnext()
+        if next is not None and not _is_good(next, index):
+            next.drop_tree()
+        e = e.getparent()
+
+def _is_good(e, index):
+    return e.get('good') or index.get(e, 0) & _GOOD_CHILD
+
+def _attached(el, root):
+    top = el
+    for top in el.iterancestors():
+        pass
+    return top is root
+
+def _clean(root, kill, remove):
+    if root.tag in _remove_tags:
+        root.tag = 'div'
+        root.attrib.clear()
+    elif root.tag in _kill_tags:
+        if root.tag != 'html':
+            root.tag = 'div'
+        root.clear()
+    elif root.tag not in defs.tags:
+        root.tag = 'div'
+        root.attrib.clear()
+
+    # elements within subtrees dropped meanwhile are still dropped or
+    # unwrapped there, which doesn't affect the tree, only the heads of
+    # dropped subtrees are left alone as they have no parent to merge into
+    for el in kill:
+        if el is not root and el.getparent() is not None:
+            el.drop_tree()
+    for el in remove:
+        if el is not root and el.getparent() is not None:
+            el.drop_tag()
+
+def _garden(root):
+    elements = list(root.iter())
+    for el in elements:
+        if el.get('good') is not None:
+            del el.attrib['good']
+        text = el.text
+        if text is not None:
+            normalized = _normalize_space(text)
+            if normalized != text:
+                el.text = normalized
+        tail = el.tail
+        if tail is not None:
+            normalized = _normalize_space(tail)
+            if normalized != tail:
+                el.tail = normalized
+
+    for el in reversed(elements):
+        if el is root:
+            continue
+        # remove all elems which have no content
+        if len(el) == 0:
+            if el.tag != 'img' and not el.text:
+                el.drop_tree()
+        # unwrap elements which only do
+        elif len(el) == 1 and not el.text:
+            el.drop_tag()
+
+def _normalize_space(text):
+    if text and _letter_re.search(text):
+        return _space_re.sub(' ', text)
+    return None
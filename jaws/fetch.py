@@ -0,0 +1,374 @@
+"""
+
+    jaws.fetch -- fetching documents over HTTP
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import time
+import Queue
+import codecs
+import httplib
+import socket
+import threading
+import urllib2
+import urlparse
+from collections import namedtuple
+from contextlib import closing
+from cookielib import CookieJar
+
+from chardet.universaldetector import UniversalDetector
+
+import justext.core
+
+__all__ = ('Fetcher', 'Fetched', 'ConnectionPool', 'ConcurrencyLimiter',
+    'fetch_many', 'read_body', 'detect_encoding')
+
+USER_AGENT = (
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8)'
+    'AppleWebKit/536.25 (KHTML, like Gecko)'
+    'Version/6.0 Safari/536.25')
+
+DEFAULT_TIMEOUT = 30
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024
+DEFAULT_MAX_CONNECTIONS_PER_HOST = 4
+CHUNK_SIZE = 64 * 1024
+# number of leading bytes inspected for <meta> charset and by chardet
+SNIFF_SIZE = 64 * 1024
+
+Fetched = namedtuple('Fetched', 'url data encoding headers')
+
+def read_body(response, max_size=None, chunk_size=CHUNK_SIZE):
+    """ Read body of ``response`` in chunks, at most ``max_size`` bytes"""
+    chunks = []
+    size = 0
+    while not max_size or size < max_size:
+        if max_size:
+            chunk_size = min(chunk_size, max_size - size)
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+    return ''.join(chunks)
+
+def _known_encoding(encoding):
+    if not encoding:
+        return None
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        return None
+    return encoding
+
+def detect_encoding(data, charset=None):
+    """ Detect character encoding of HTML document ``data``
+
+    Encoding is taken from ``charset`` (as found in Content-Type header),
+    <meta> tags or guessed by chardet, the last two only look at the first
+    ``SNIFF_SIZE`` bytes of ``data``. If these are all ASCII, e.g. inline
+    scripts, the rest of ``data`` is checked for UTF-8 or guessed from.
+    Returns None if encoding can't be detected.
+    """
+    encoding = _known_encoding(charset)
+    if encoding:
+        return encoding
+    prefix = data[:SNIFF_SIZE]
+    encoding = justext.core.find_meta_encoding(prefix)
+    if encoding:
+        return encoding
+    encoding = _guess_encoding(prefix)
+    if encoding == 'ascii' and len(data) > SNIFF_SIZE:
+        rest = data[SNIFF_SIZE:]
+        if justext.core.is_utf8(rest):
+            return 'utf-8'
+        encoding = _guess_encoding(rest)
+    return encoding
+
+def _guess_encoding(data):
+    detector = UniversalDetector()
+    for pos in xrange(0, len(data), 4096):
+        detector.feed(data[pos:pos + 4096])
+        if detector.done:
+            break
+    detector.close()
+    return _known_encoding(detector.result.get('encoding'))
+
+class ConnectionPool(object):
+    """ Idle HTTP connections kept alive for reuse, per host"""
+
+    def __init__(self, max_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST):
+        self.max_per_host = max_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """ Return an idle connection for ``key`` or None"""
+        with self._lock:
+            connections = self._idle.get(key)
+            if connections:
+                return connections.pop()
+
+    def put(self, key, connection):
+        """ Return ``connection`` to the pool, close it if the pool is full"""
+        with self._lock:
+            connections = self._idle.setdefault(key, [])
+            if len(connections) < self.max_per_host:
+                connections.append(connection)
+                return
+        connection.close()
+
+    def clear(self):
+        """ Close all idle connections"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+class ConcurrencyLimiter(object):
+    """ Limits number of operations in progress per key, e.g. per host"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._active = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, key, timeout=None):
+        """ Wait for a free slot for ``key``, return False if there was none
+        within ``timeout`` seconds"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._active.get(key, 0) >= self.limit:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                self._cond.wait(remaining)
+            self._active[key] = self._active.get(key, 0) + 1
+            return True
+
+    def release(self, key):
+        with self._cond:
+            active = self._active[key] - 1
+            if active:
+                self._active[key] = active
+            else:
+                del self._active[key]
+            self._cond.notify()
+
+class _LimitedResponse(object):
+    """ Wrapper for response which frees its host's slot once closed"""
+
+    def __init__(self, response, release):
+        self._response = response
+        self._release = release
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def close(self):
+        self._response.close()
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+class _PooledResponse(object):
+    """ Wrapper for HTTP response which returns connection to the pool once
+    response is closed after being read completely"""
+
+    def __init__(self, response, connection, release):
+        self.response = response
+        self.connection = connection
+        self.release = release
+
+    def recv(self, amt):
+        return self.response.read(amt)
+
+    def close(self):
+        if self.connection is None:
+            return
+        # httplib closes response by itself once its body was read
+        reusable = self.response.isclosed() and not self.response.will_close
+        self.response.close()
+        if reusable:
+            self.release(self.connection)
+        else:
+            self.connection.close()
+        self.connection = None
+
+class _KeepAliveMixin(object):
+
+    def __init__(self, pool):
+        urllib2.AbstractHTTPHandler.__init__(self)
+        self.pool = pool
+
+    def _open_pooled(self, http_class, req):
+        """ Same as do_open but takes connections from the pool and doesn't
+        ask server to close them"""
+        host = req.get_host()
+        if not host:
+            raise urllib2.URLError('no host given')
+        key = (http_class, host)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update(dict((k, v) for k, v in req.headers.items()
+                            if k not in headers))
+        headers['Connection'] = 'keep-alive'
+        headers = dict(
+            (name.title(), val) for name, val in headers.items())
+
+        while True:
+            h = self.pool.get(key)
+            reused = h is not None
+            if reused:
+                if h.sock is not None:
+                    h.sock.settimeout(req.timeout)
+            else:
+                h = http_class(host, timeout=req.timeout)
+            try:
+                h.request(req.get_method(), req.get_selector(), req.data,
+                    headers)
+                r = h.getresponse(buffering=True)
+            except (socket.error, httplib.HTTPException) as e:
+                h.close()
+                # server could have dropped idle connection, retry with
+                # another one
+                if reused:
+                    continue
+                raise urllib2.URLError(e)
+            break
+
+        release = lambda connection: self.pool.put(key, connection)
+        fp = socket._fileobject(
+            _PooledResponse(r, h, release), close=True)
+        resp = urllib2.addinfourl(fp, r.msg, req.get_full_url())
+        resp.code = r.status
+        resp.msg = r.reason
+        return resp
+
+class KeepAliveHTTPHandler(_KeepAliveMixin, urllib2.HTTPHandler):
+
+    def http_open(self, req):
+        return self._open_pooled(httplib.HTTPConnection, req)
+
+class KeepAliveHTTPSHandler(_KeepAliveMixin, urllib2.HTTPSHandler):
+
+    def https_open(self, req):
+        return self._open_pooled(httplib.HTTPSConnection, req)
+
+class Fetcher(object):
+    """ Fetches documents over HTTP keeping connections to hosts alive between
+    requests
+
+    :param timeout:
+        socket timeout in seconds
+    :param max_size:
+        maximum number of bytes read from response body, the rest is
+        discarded
+    :param max_connections_per_host:
+        maximum number of idle connections kept per host
+    :param max_requests_per_host:
+        maximum number of requests to a host in progress at once, others
+        wait up to ``timeout`` seconds for their turn
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_size=DEFAULT_MAX_SIZE,
+            max_connections_per_host=DEFAULT_MAX_CONNECTIONS_PER_HOST,
+            max_requests_per_host=None):
+        self.timeout = timeout
+        self.max_size = max_size
+        self.pool = ConnectionPool(max_connections_per_host)
+        self.hosts = None
+        if max_requests_per_host:
+            self.hosts = ConcurrencyLimiter(max_requests_per_host)
+
+    def open(self, url, headers=None):
+        """ Open ``url`` and return file-like response object
+
+        Cookies are kept for the time of a single request, that is, across
+        redirects. If requests per host are limited, response must be closed
+        to let other requests to its host proceed.
+        """
+        if self.hosts is None:
+            return self._open(url, headers)
+        host = urlparse.urlsplit(url).hostname
+        if not self.hosts.acquire(host, self.timeout):
+            raise urllib2.URLError('too many requests to %s' % host)
+        try:
+            response = self._open(url, headers)
+        except:
+            self.hosts.release(host)
+            raise
+        return _LimitedResponse(response, lambda: self.hosts.release(host))
+
+    def _open(self, url, headers):
+        request_headers = {'User-Agent': USER_AGENT}
+        request_headers.update(headers or {})
+        request = urllib2.Request(url, None, request_headers)
+        opener = urllib2.build_opener(
+            urllib2.HTTPCookieProcessor(CookieJar()),
+            KeepAliveHTTPHandler(self.pool),
+            KeepAliveHTTPSHandler(self.pool))
+        return opener.open(request, timeout=self.timeout)
+
+    def fetch(self, url, headers=None):
+        """ Fetch body of ``url`` up to ``max_size`` bytes along with its
+        character encoding and response headers"""
+        with closing(self.open(url, headers=headers)) as response:
+            data = read_body(response, self.max_size)
+            info = response.info()
+            return Fetched(response.geturl(), data,
+                detect_encoding(data, info.getparam('charset')), info)
+
+    def close(self):
+        """ Close all idle connections"""
+        self.pool.clear()
+
+def fetch_many(urls, func, concurrency=8, timeout=None):
+    """ Apply ``func`` to each of ``urls`` using ``concurrency`` threads
+
+    Yields ``(url, result)`` pairs in order of completion, ``result`` is the
+    exception instance if ``func`` raised one. If ``timeout`` is given, stops
+    once that many seconds have passed, URLs which weren't done by then are
+    left out.
+    """
+    urls = list(urls)
+    deadline = None if timeout is None else time.time() + timeout
+    tasks = Queue.Queue()
+    results = Queue.Queue()
+    stopped = threading.Event()
+    for url in urls:
+        tasks.put(url)
+
+    def _worker():
+        while not stopped.is_set():
+            if deadline is not None and time.time() > deadline:
+                return
+            try:
+                url = tasks.get_nowait()
+            except Queue.Empty:
+                return
+            try:
+                results.put((url, func(url)))
+            except Exception as e:
+                results.put((url, e))
+
+    # threads which are still fetching once results aren't wanted anymore
+    # are left to finish in background rather than waited for
+    for _ in xrange(min(concurrency, len(urls))):
+        thread = threading.Thread(target=_worker)
+        thread.daemon = True
+        thread.start()
+    try:
+        for _ in urls:
+            if deadline is None:
+                yield results.get()
+                continue
+            try:
+                yield results.get(timeout=max(0, deadline - time.time()))
+            except Queue.Empty:
+                return
+    finally:
+        stopped.set()
@@ -5,61 +5,99 @@
 
 """
 
+import httplib
 import itertools
+import struct
+import time
 import urllib2
 import urlparse
-from cStringIO import StringIO
+from contextlib import closing
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool, AsyncResult
 
 import lxml.html
 import justext
-import Image
+import ImageFile
 
 from . import utils
+from .fetch import Fetcher
+from .cache import LRUCache, SQLiteCache, TieredCache
+from .metadata import Metadata
+from .metrics import metrics
 
-__all__ = ('extract_cover_image',)
+__all__ = ('extract_cover_image', 'extract_meta_image', 'image_size',
+    'probe_image_sizes', 'parse_image_size', 'configure_size_cache')
 
-def extract_cover_image(doc, url, paragraphs=None, min_image_size=None):
+# image sizes are read from the first PROBE_SIZE bytes, PROBE_CHUNK_SIZE bytes
+# at a time
+PROBE_SIZE = 256 * 1024
+PROBE_CHUNK_SIZE = 16 * 1024
+PROBE_CONCURRENCY = 8
+# seconds to spend probing image sizes per document
+PROBE_BUDGET = 10
+
+SIZE_CACHE_MAXSIZE = 10000
+SIZE_CACHE_DB_MAXSIZE = 1000000
+SIZE_CACHE_TTL = 7 * 24 * 3600
+# missing and undecodable images are remembered for a shorter time
+SIZE_CACHE_NEGATIVE_TTL = 3600
+
+_fetcher = Fetcher(timeout=PROBE_BUDGET)
+
+# probed image sizes by normalized URL, None for images which couldn't be
+# probed, replace with configure_size_cache() or pass ``cache`` explicitly
+size_cache = LRUCache(SIZE_CACHE_MAXSIZE, ttl=SIZE_CACHE_TTL)
+metrics.add_cache('image_sizes', size_cache)
+
+def configure_size_cache(path=None, maxsize=SIZE_CACHE_MAXSIZE,
+        ttl=SIZE_CACHE_TTL, db_maxsize=SIZE_CACHE_DB_MAXSIZE):
+    """ Set up image size cache used by default
+
+    :param path:
+        path to SQLite database shared between processes, only in-process
+        cache is used if it's None
+    :param db_maxsize:
+        maximum number of entries kept in the database
+    """
+    global size_cache
+    cache = LRUCache(maxsize, ttl=ttl)
+    if path:
+        cache = TieredCache(cache,
+            SQLiteCache(path, ttl=ttl, max_entries=db_maxsize))
+    size_cache = cache
+    metrics.add_cache('image_sizes', cache)
+    return cache
+
+def extract_cover_image(doc, url, paragraphs=None, min_image_size=None,
+        probe_budget=PROBE_BUDGET, size_cache=None):
     """ Extract cover image from doc
 
     :param doc:
         HTML document as a string or as a parsed
     :param min_image_size:
         minimum allowed image size
+    :param probe_budget:
+        seconds to spend on probing image sizes, candidates which weren't
+        probed in time are skipped
+    :param size_cache:
+        cache of image sizes consulted before probing, module's
+        ``size_cache`` by default
     """
     if isinstance(doc, basestring):
         doc = lxml.html.fromstring(doc)
 
-    def _find_og_meta_image(doc):
-        metas = doc.xpath('//meta[@property="og:image"]')
-        if metas:
-            # some open graph submitted images can be too generic, try to filter
-            # them
-            for meta in metas:
-                if not meta.attrib.get('content'):
-                    continue
-                content = meta.attrib['content']
-                if _image_opengraph_banned.search(content):
-                    continue
-                yield content
-
-    def _find_twitter_meta_image(doc):
-        metas = doc.xpath('//meta[@name="twitter:image"]')
-        for meta in metas:
-            if meta.attrib.get('content'):
-                yield meta.attrib['content']
-
     def _find_heueristics(doc):
         ps = paragraphs or justext.justext(
-            doc, justext.get_stoplist('English'))
+            doc, justext.get_stoplist('English'), xpaths=False,
+            sax=False)
+        elements = justext.list_elements(doc)
         prev = None
         images = []
         for p in ps:
             if p['class'] == 'good':
-                xpath = p['xpath']
-                e = doc.xpath(xpath)
-                if not e:
+                if p['node'] is None:
                     continue
-                e = e[0]
+                e = elements[p['node']]
                 for prec in utils.precedings(e,
                         before=lambda x: prev is not None and prev is e):
                     if prec.tag == 'img' and prec.attrib.get('src'):
@@ -72,29 +110,208 @@ def extract_cover_image(doc, url, paragraphs=None, min_image_size=None):
                     continue
                 yield image
 
-    funcs = (_find_og_meta_image, _find_twitter_meta_image, _find_heueristics)
-    for image in itertools.chain(*(f(doc) for f in funcs)):
+    funcs = (_find_meta_images, _find_heueristics)
+    images = (urlparse.urljoin(url, image)
+        for image in itertools.chain(*(f(doc) for f in funcs)))
+    images = (image for image in images if image)
+
+    if not min_image_size:
+        for image in images:
+            return image.strip()
+        return None
+
+    if isinstance(min_image_size, tuple):
+        (mw, mh) = min_image_size
+    else:
+        (mw, mh) = (min_image_size, min_image_size)
+    probed = probe_image_sizes(list(images), budget=probe_budget,
+        cache=size_cache)
+    for image, size in probed:
+        if size is None:
+            continue
+        (w, h) = size
+        if mw is not None and w < mw:
+            continue
+        if mh is not None and h < mh:
+            continue
+        return image.strip()
+
+_missing = object()
+
+def extract_meta_image(doc, url):
+    """ Extract cover image declared by Open Graph or Twitter <meta> tags
+
+    Unlike :func:`extract_cover_image` this only needs document's <head>,
+    ``doc`` can also be a :class:`jaws.metadata.Metadata`.
+    """
+    if isinstance(doc, basestring):
+        doc = lxml.html.fromstring(doc)
+    for image in _find_meta_images(doc):
         image = urlparse.urljoin(url, image)
         if image:
-            if min_image_size:
-                if isinstance(min_image_size, tuple):
-                    (mw, mh) = min_image_size
-                else:
-                    (mw, mh) = (min_image_size, min_image_size)
-                (w, h) = image_size(image)
-                if mw is not None and w < mw:
-                    continue
-                if mh is not None and h < mh:
-                    continue
             return image.strip()
 
-def image_size(url):
-    data = urllib2.urlopen(url)
-    infp = StringIO()
-    infp.write(data.read())
-    infp.seek(0)
-    img = Image.open(infp)
-    return img.size
+def _find_meta_images(doc):
+    if isinstance(doc, Metadata):
+        og = doc.properties.get('og:image', [])
+        twitter = doc.names.get('twitter:image', [])
+    else:
+        og = (meta.attrib.get('content')
+            for meta in doc.xpath('//meta[@property="og:image"]'))
+        twitter = (meta.attrib.get('content')
+            for meta in doc.xpath('//meta[@name="twitter:image"]'))
+    return itertools.chain(
+        _find_og_meta_image(og), _find_twitter_meta_image(twitter))
+
+def _find_og_meta_image(contents):
+    # some open graph submitted images can be too generic, try to filter
+    # them
+    for content in contents:
+        if not content:
+            continue
+        if _image_opengraph_banned.search(content):
+            continue
+        yield content
+
+def _find_twitter_meta_image(contents):
+    for content in contents:
+        if content:
+            yield content
+
+def probe_image_sizes(urls, budget=PROBE_BUDGET,
+        concurrency=PROBE_CONCURRENCY, cache=None):
+    """ Probe sizes of images at ``urls`` concurrently
+
+    Yields ``(url, size)`` pairs in order of ``urls``, ``size`` is None if
+    it couldn't be determined within ``budget`` seconds. Sizes are looked up
+    in and stored to ``cache`` (module's ``size_cache`` by default).
+    """
+    cache = size_cache if cache is None else cache
+    sizes = {}
+    missing = []
+    for url in urls:
+        if url not in sizes:
+            sizes[url] = cache.get(utils.normalize_url(url), _missing)
+            if sizes[url] is _missing:
+                missing.append(url)
+    pool = None
+    if missing:
+        deadline = time.time() + budget
+        pool = ThreadPool(min(len(missing), concurrency))
+        for url in missing:
+            sizes[url] = pool.apply_async(_probe_image_size, (url, cache))
+    try:
+        for url in urls:
+            size = sizes[url]
+            if isinstance(size, AsyncResult):
+                try:
+                    size = size.get(max(0, deadline - time.time()))
+                except TimeoutError:
+                    size = None
+            yield url, size
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+def _probe_image_size(url, cache):
+    key = utils.normalize_url(url)
+    try:
+        size = image_size(url)
+    except urllib2.HTTPError as e:
+        if 400 <= e.code < 500:
+            cache.set(key, None, ttl=SIZE_CACHE_NEGATIVE_TTL)
+        return None
+    except ValueError:
+        # not an image or a format we can't decode
+        cache.set(key, None, ttl=SIZE_CACHE_NEGATIVE_TTL)
+        return None
+    except (IOError, httplib.HTTPException):
+        # network errors are likely transient, don't cache them
+        return None
+    cache.set(key, size)
+    return size
+
+def image_size(url, fetcher=None):
+    """ Return ``(width, height)`` of image at ``url``
+
+    Only the beginning of the image is downloaded, just enough to read its
+    header. Raises ValueError if image format can't be recognized.
+    """
+    fetcher = fetcher or _fetcher
+    headers = {'Range': 'bytes=0-%d' % (PROBE_SIZE - 1)}
+    data = ''
+    with closing(fetcher.open(url, headers=headers)) as response:
+        while len(data) < PROBE_SIZE:
+            chunk = response.read(
+                min(PROBE_CHUNK_SIZE, PROBE_SIZE - len(data)))
+            if not chunk:
+                break
+            data += chunk
+            size = parse_image_size(data)
+            if size:
+                return size
+    # some other format, let PIL try to make sense of it
+    parser = ImageFile.Parser()
+    try:
+        parser.feed(data)
+    except IOError:
+        pass
+    if parser.image is None:
+        raise ValueError('cannot identify image at %s' % url)
+    return parser.image.size
+
+def parse_image_size(data):
+    """ Return ``(width, height)`` from PNG, GIF, JPEG or WebP header at the
+    beginning of ``data``, None if format is unknown or more data is needed
+    """
+    if data[:8] == '\x89PNG\r\n\x1a\n':
+        if len(data) >= 24 and data[12:16] == 'IHDR':
+            return struct.unpack('>II', data[16:24])
+    elif data[:6] in ('GIF87a', 'GIF89a'):
+        if len(data) >= 10:
+            return struct.unpack('<HH', data[6:10])
+    elif data[:4] == 'RIFF' and data[8:12] == 'WEBP':
+        return _parse_webp_size(data)
+    elif data[:2] == '\xff\xd8':
+        return _parse_jpeg_size(data)
+
+def _parse_webp_size(data):
+    chunk = data[12:16]
+    if chunk == 'VP8 ' and len(data) >= 30:
+        (w, h) = struct.unpack('<HH', data[26:30])
+        return (w & 0x3fff, h & 0x3fff)
+    elif chunk == 'VP8L' and len(data) >= 25:
+        (bits,) = struct.unpack('<I', data[21:25])
+        return ((bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1)
+    elif chunk == 'VP8X' and len(data) >= 30:
+        w = struct.unpack('<I', data[24:27] + '\x00')[0] + 1
+        h = struct.unpack('<I', data[27:30] + '\x00')[0] + 1
+        return (w, h)
+
+# start of frame markers, the rest of 0xc0-0xcf are DHT, JPG and DAC
+_jpeg_sof_markers = frozenset(range(0xc0, 0xd0)) - set((0xc4, 0xc8, 0xcc))
+
+def _parse_jpeg_size(data):
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != '\xff':
+            return None
+        marker = ord(data[pos + 1])
+        if marker == 0xff:
+            # fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xd0 <= marker <= 0xd9:
+            # markers without payload
+            pos += 2
+            continue
+        if marker in _jpeg_sof_markers:
+            if pos + 9 > len(data):
+                return None
+            (h, w) = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return (w, h)
+        (length,) = struct.unpack('>H', data[pos + 2:pos + 4])
+        pos += 2 + length
 
 _image_urls_banned = utils.gen_matches_any(
     'avatar', '\.gif', '\.ico', 'logo', 'ads')
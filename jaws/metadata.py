@@ -0,0 +1,162 @@
+"""
+
+    jaws.metadata -- metadata from document's <head>
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import lxml.etree
+
+__all__ = ('Metadata', 'MetadataParser', 'parse_metadata', 'read_metadata')
+
+CHUNK_SIZE = 8 * 1024
+
+# elements which may appear in <head>, any other one starts the body
+_head_tags = frozenset((
+    'html', 'head', 'title', 'meta', 'link', 'base', 'script', 'style',
+    'noscript', 'template', 'object', 'param'))
+# elements in <head> which may contain body ones, e.g. tracking pixels
+_fallback_tags = frozenset(('noscript', 'template'))
+
+class Metadata(object):
+    """ Metadata found in document's <head>
+
+    Values of <meta> tags are kept in lists in document order, by their
+    ``name``, ``property`` (Open Graph) and ``itemprop`` attributes.
+    """
+
+    def __init__(self):
+        self.title = None
+        self.names = {}
+        self.properties = {}
+        self.itemprops = {}
+
+    def __repr__(self):
+        return '<Metadata %r>' % self.title
+
+    @property
+    def og(self):
+        """ Open Graph properties, first value of each"""
+        return dict((name[3:], values[0])
+            for name, values in self.properties.items()
+            if name.startswith('og:'))
+
+    @property
+    def twitter(self):
+        """ Twitter card metadata, first value of each"""
+        return dict((name[8:], values[0])
+            for name, values in self.names.items()
+            if name.startswith('twitter:'))
+
+    @property
+    def author(self):
+        values = self.names.get('author')
+        return values[0] if values else None
+
+class _MetadataTarget(object):
+    """ lxml parser target collecting :class:`Metadata` until the end of
+    <head>"""
+
+    def __init__(self):
+        self.metadata = Metadata()
+        self.done = False
+        self._title = None
+        self._fallback = 0
+
+    def start(self, tag, attrib):
+        if self.done:
+            return
+        if tag == 'meta':
+            content = attrib.get('content')
+            if content:
+                for attr, values in (
+                        ('name', self.metadata.names),
+                        ('property', self.metadata.properties),
+                        ('itemprop', self.metadata.itemprops)):
+                    if attr in attrib:
+                        values.setdefault(attrib[attr], []).append(content)
+        elif tag == 'title':
+            self._title = []
+        elif tag in _fallback_tags:
+            self._fallback += 1
+        elif tag not in _head_tags and not self._fallback:
+            self.done = True
+
+    def end(self, tag):
+        if tag == 'title' and self._title is not None:
+            title = ''.join(self._title).strip()
+            if title and self.metadata.title is None:
+                self.metadata.title = title
+            self._title = None
+        elif tag in _fallback_tags and self._fallback:
+            self._fallback -= 1
+        elif tag == 'head':
+            self.done = True
+
+    def data(self, data):
+        if self._title is not None:
+            self._title.append(data)
+
+    def close(self):
+        return self.metadata
+
+class MetadataParser(object):
+    """ Incremental parser collecting :class:`Metadata` from HTML fed to it
+
+    No tree is built, ``done`` is set once the end of <head> was seen and
+    the rest of the document doesn't need to be fed.
+    """
+
+    def __init__(self, encoding=None):
+        self._target = _MetadataTarget()
+        try:
+            self._parser = lxml.etree.HTMLParser(
+                target=self._target, encoding=encoding)
+        except LookupError:
+            # let libxml2 detect encoding itself
+            self._parser = lxml.etree.HTMLParser(target=self._target)
+
+    @property
+    def done(self):
+        return self._target.done
+
+    def feed(self, data):
+        """ Feed ``data`` to parser, return True if <head> ended"""
+        self._parser.feed(data)
+        return self.done
+
+    def close(self):
+        """ Return collected :class:`Metadata`"""
+        return self._parser.close()
+
+def parse_metadata(data, encoding=None, chunk_size=CHUNK_SIZE):
+    """ Return :class:`Metadata` of HTML document ``data``, only parsing its
+    <head>"""
+    parser = MetadataParser(encoding)
+    for pos in xrange(0, len(data), chunk_size):
+        if parser.feed(data[pos:pos + chunk_size]):
+            break
+    return parser.close()
+
+def read_metadata(response, max_size=None, encoding=None,
+        chunk_size=CHUNK_SIZE):
+    """ Read HTML ``response`` until the end of its <head>, at most
+    ``max_size`` bytes
+
+    Returns data read along with its :class:`Metadata`, the rest of the body
+    can be read from ``response`` afterwards.
+    """
+    parser = MetadataParser(encoding)
+    chunks = []
+    size = 0
+    while not max_size or size < max_size:
+        if max_size:
+            chunk_size = min(chunk_size, max_size - size)
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        size += len(chunk)
+        if parser.feed(chunk):
+            break
+    return ''.join(chunks), parser.close()
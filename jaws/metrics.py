@@ -0,0 +1,209 @@
+"""
+
+    jaws.metrics -- timings of extraction stages
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import os
+import re
+import sys
+import time
+import bisect
+import resource
+import cProfile
+import threading
+from contextlib import contextmanager
+
+__all__ = ('Timings', 'Histogram', 'Metrics', 'metrics', 'profile_slow',
+    'thread_time')
+
+# upper bounds of histogram buckets
+TIME_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = {
+    'bytes': tuple(1024 * 4 ** n for n in range(9)),
+    'elements': (100, 300, 1000, 3000, 10000, 30000, 100000),
+    'paragraphs': (10, 30, 100, 300, 1000, 3000),
+    }
+
+# Python 2 doesn't define RUSAGE_THREAD, it's 1 on Linux
+_RUSAGE_THREAD = getattr(resource, 'RUSAGE_THREAD',
+    1 if sys.platform.startswith('linux') else None)
+
+def thread_time():
+    """ Return CPU time of the current thread, None if it can't be told
+    apart from that of the whole process"""
+    if _RUSAGE_THREAD is None:
+        return None
+    usage = resource.getrusage(_RUSAGE_THREAD)
+    return usage.ru_utime + usage.ru_stime
+
+class Timings(object):
+    """ Wall and CPU time spent in named stages of processing a document,
+    along with its sizes
+
+    Time of stages with the same name adds up. CPU time is of the thread
+    running the stage, it's left at zero where :func:`thread_time` isn't
+    supported.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.sizes = {}
+
+    def __repr__(self):
+        return '<Timings %s>' % ', '.join(
+            '%s=%.4f' % (name, wall)
+            for name, (wall, cpu) in sorted(self.stages.items()))
+
+    @contextmanager
+    def stage(self, name):
+        """ Time code run within as stage ``name``"""
+        wall, cpu = time.time(), thread_time()
+        try:
+            yield
+        finally:
+            wall = time.time() - wall
+            self.add(name, wall, 0.0 if cpu is None else thread_time() - cpu)
+
+    def add(self, name, wall, cpu=0.0):
+        (total_wall, total_cpu) = self.stages.get(name, (0.0, 0.0))
+        self.stages[name] = (total_wall + wall, total_cpu + cpu)
+
+    def update(self, other):
+        """ Add stages and sizes of ``other`` timings"""
+        for name, (wall, cpu) in other.stages.items():
+            self.add(name, wall, cpu)
+        self.sizes.update(other.sizes)
+
+class Histogram(object):
+    """ Counts of observed values by buckets with upper ``bounds``"""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """ Return ``(bound, count)`` pairs, counts of values up to bound,
+        the last bound is None"""
+        total = 0
+        for bound, count in zip(self.bounds + (None,), self.counts):
+            total += count
+            yield bound, total
+
+class Metrics(object):
+    """ Aggregated :class:`Timings` of processed documents, along with hit
+    and miss counters of caches added
+
+    Metrics are kept by each process, they are rendered with its ``pid``
+    label, so that series of processes serving on the same socket can be
+    told apart and summed up.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.caches = {}
+        self.clear()
+
+    def add_cache(self, name, cache):
+        """ Report ``stats()`` of ``cache`` as ``name``, replacing cache
+        added under this name before"""
+        with self._lock:
+            self.caches[name] = cache
+
+    def clear(self):
+        with self._lock:
+            self.stages = {}
+            self.cpu = {}
+            self.sizes = dict(
+                (name, Histogram(bounds))
+                for name, bounds in SIZE_BUCKETS.items())
+
+    def observe(self, timings):
+        with self._lock:
+            for name, (wall, cpu) in timings.stages.items():
+                if name not in self.stages:
+                    self.stages[name] = Histogram(TIME_BUCKETS)
+                    self.cpu[name] = 0.0
+                self.stages[name].observe(wall)
+                self.cpu[name] += cpu
+            for name, size in timings.sizes.items():
+                if name in self.sizes:
+                    self.sizes[name].observe(size)
+
+    def render(self):
+        """ Return metrics in Prometheus text format"""
+        lines = []
+        labels = 'pid="%d",' % os.getpid()
+        with self._lock:
+            lines.append('# TYPE jaws_stage_seconds histogram')
+            for name, histogram in sorted(self.stages.items()):
+                _render_histogram(lines, 'jaws_stage_seconds', histogram,
+                    '%sstage="%s",' % (labels, name))
+            if _RUSAGE_THREAD is not None:
+                lines.append('# TYPE jaws_stage_cpu_seconds_total counter')
+                for name, cpu in sorted(self.cpu.items()):
+                    lines.append(
+                        'jaws_stage_cpu_seconds_total{%sstage="%s"} %r' % (
+                            labels, name, cpu))
+            for name, histogram in sorted(self.sizes.items()):
+                metric = 'jaws_document_%s' % name
+                lines.append('# TYPE %s histogram' % metric)
+                _render_histogram(lines, metric, histogram, labels)
+            caches = sorted(self.caches.items())
+        _render_caches(lines, caches, labels)
+        return '\n'.join(lines) + '\n'
+
+def _render_histogram(lines, metric, histogram, labels=''):
+    for bound, count in histogram.cumulative():
+        lines.append('%s_bucket{%sle="%s"} %d' % (
+            metric, labels, '+Inf' if bound is None else bound, count))
+    labels = '{%s}' % labels.rstrip(',') if labels else ''
+    lines.append('%s_sum%s %r' % (metric, labels, histogram.sum))
+    lines.append('%s_count%s %d' % (metric, labels, histogram.count))
+
+def _render_caches(lines, caches, labels=''):
+    # tiers of tiered caches are counted separately
+    stats = []
+    for name, cache in caches:
+        cache_stats = cache.stats()
+        for n, tier in enumerate(cache_stats.get('tiers', [cache_stats])):
+            stats.append(('%scache="%s",tier="%d"' % (labels, name, n), tier))
+    for counter in ('hits', 'misses'):
+        metric = 'jaws_cache_%s_total' % counter
+        lines.append('# TYPE %s counter' % metric)
+        for labels, tier in stats:
+            lines.append('%s{%s} %d' % (metric, labels, tier[counter]))
+
+# metrics of this process
+metrics = Metrics()
+
+@contextmanager
+def profile_slow(threshold, directory, name):
+    """ Profile code run within and dump its stats to ``directory`` if it
+    took at least ``threshold`` seconds
+
+    Only the current thread is profiled. Stats are written in
+    :mod:`pstats` format to a file named after ``name`` and time taken.
+    """
+    profiler = cProfile.Profile()
+    started = time.time()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.time() - started
+        if elapsed >= threshold:
+            filename = '%s-%d-%d-%.3fs.prof' % (
+                re.sub(r'\W+', '_', name).strip('_') or 'root',
+                started * 1000, os.getpid(), elapsed)
+            profiler.dump_stats(os.path.join(directory, filename))
@@ -0,0 +1,233 @@
+"""
+
+    jaws.serve -- threaded HTTP server for jaws.server application
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Requests are handled by threads which spend most of their time waiting
+    on upstream servers, CPU bound extraction is done by a bounded pool of
+    processes, so a few such servers can replace many single-threaded ones.
+
+"""
+
+import socket
+import threading
+import multiprocessing
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+from docopt import docopt
+from webob.exc import HTTPTooManyRequests, HTTPGatewayTimeout
+import justext
+
+from . import server
+from .fetch import Fetcher, ConcurrencyLimiter
+
+__all__ = ('ProcessPoolExtractor', 'ThreadedWSGIServer', 'limit_clients',
+    'serve')
+
+# seconds a single document may take to extract
+EXTRACT_TIMEOUT = 60
+
+def _init_worker():
+    justext.preload_stoplists(['English'])
+
+class ProcessPoolExtractor(object):
+    """ Runs :func:`jaws.server.extract_fields` in a pool of processes
+
+    Pool is started on first use, so it's safe to create the extractor
+    before server processes are forked. Once an extraction times out the
+    pool is replaced, the old one is terminated along with the stuck worker
+    when jobs sent to it are done or timed out too.
+    """
+
+    def __init__(self, processes=None, timeout=EXTRACT_TIMEOUT):
+        self.processes = processes
+        self.timeout = timeout
+        self._pool = None
+        # number of jobs in progress by pool, including replaced ones
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, data, url, encoding, fields):
+        pool = self._acquire()
+        try:
+            job = pool.apply_async(server.extract_fields,
+                (data, url, encoding, fields))
+            try:
+                return job.get(self.timeout)
+            except multiprocessing.TimeoutError:
+                self._replace(pool)
+                raise HTTPGatewayTimeout('extraction took too long')
+        finally:
+            self._release(pool)
+
+    def _acquire(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = multiprocessing.Pool(self.processes, _init_worker)
+            pool = self._pool
+            self._jobs[pool] = self._jobs.get(pool, 0) + 1
+            return pool
+
+    def _replace(self, pool):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+
+    def _release(self, pool):
+        with self._lock:
+            if pool not in self._jobs:
+                # terminated by close() meanwhile
+                return
+            self._jobs[pool] -= 1
+            if self._jobs[pool] or pool is self._pool:
+                return
+            del self._jobs[pool]
+        pool.terminate()
+
+    def close(self):
+        with self._lock:
+            pools = set(self._jobs)
+            if self._pool is not None:
+                pools.add(self._pool)
+            self._pool = None
+            self._jobs = {}
+        for pool in pools:
+            pool.terminate()
+
+def limit_clients(app, max_per_client):
+    """ Wrap WSGI ``app`` responding with 429 to clients which have more than
+    ``max_per_client`` requests in progress"""
+    clients = ConcurrencyLimiter(max_per_client)
+
+    def _app(environ, start_response):
+        client = environ.get('REMOTE_ADDR')
+        if not clients.acquire(client, timeout=0):
+            response = HTTPTooManyRequests()
+            return response(environ, start_response)
+        try:
+            body = app(environ, start_response)
+        except:
+            clients.release(client)
+            raise
+        # streamed responses are in progress until server closes them
+        return _ClosingIterator(body, lambda: clients.release(client))
+    return _app
+
+class _ClosingIterator(object):
+    """ Response body which calls ``callback`` once closed"""
+
+    def __init__(self, body, callback):
+        self.body = body
+        self.callback = callback
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.callback()
+
+class _RequestHandler(WSGIRequestHandler):
+
+    def log_request(self, *args):
+        pass
+
+class ThreadedWSGIServer(ThreadingMixIn, WSGIServer):
+    """ WSGI server handling each request in a thread, at most ``threads``
+    at once
+
+    :param fd:
+        file descriptor of already bound socket to serve on, e.g. one passed
+        by circus
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, app, threads, fd=None):
+        self.fd = fd
+        self._slots = threading.BoundedSemaphore(threads)
+        WSGIServer.__init__(self, address, _RequestHandler)
+        self.set_app(app)
+
+    def server_bind(self):
+        if self.fd is None:
+            return WSGIServer.server_bind(self)
+        self.socket.close()
+        self.socket = socket.fromfd(
+            self.fd, self.address_family, self.socket_type)
+        self.server_address = self.socket.getsockname()
+        (host, port) = self.server_address[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+
+    def process_request(self, request, client_address):
+        # stop accepting connections while all threads are busy
+        self._slots.acquire()
+        try:
+            ThreadingMixIn.process_request(self, request, client_address)
+        except:
+            self._slots.release()
+            raise
+
+    def process_request_thread(self, request, client_address):
+        try:
+            ThreadingMixIn.process_request_thread(
+                self, request, client_address)
+        finally:
+            self._slots.release()
+
+def serve(host='127.0.0.1', port=8080, fd=None, threads=64, processes=None,
+        max_per_host=4, max_per_client=16):
+    """ Serve :func:`jaws.server.app` with a threaded server
+
+    :param processes:
+        number of extraction processes, number of CPUs by default
+    :param max_per_host:
+        maximum number of requests to a single upstream host at once
+    :param max_per_client:
+        maximum number of requests from a single client at once
+    """
+    extractor = ProcessPoolExtractor(processes)
+    server.configure_result_cache(
+        fetcher=Fetcher(max_requests_per_host=max_per_host),
+        extract=extractor)
+    httpd = ThreadedWSGIServer((host, port),
+        limit_clients(server.app, max_per_client), threads, fd=fd)
+    try:
+        httpd.serve_forever()
+    finally:
+        extractor.close()
+
+def main():
+    args = docopt("""
+usage: jaws-server [-h] [options]
+
+options:
+    -h, --help              show this message and exit
+
+    --host HOST             address to listen on [default: 127.0.0.1]
+    --port PORT             port to listen on [default: 8080]
+    --fd FD                 serve on already bound socket with this file
+                            descriptor instead
+    --threads N             maximum number of requests handled at once
+                            [default: 64]
+    --processes N           number of extraction processes, defaults to
+                            number of CPUs
+    --max-per-host N        maximum number of requests to a single upstream
+                            host at once [default: 4]
+    --max-per-client N      maximum number of requests from a single client
+                            at once [default: 16]
+""")
+    serve(
+        host=args['--host'],
+        port=int(args['--port']),
+        fd=int(args['--fd']) if args['--fd'] else None,
+        threads=int(args['--threads']),
+        processes=int(args['--processes']) if args['--processes'] else None,
+        max_per_host=int(args['--max-per-host']),
+        max_per_client=int(args['--max-per-client']))
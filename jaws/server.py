@@ -5,34 +5,339 @@
 
 """
 
-from routr import route, GET
-from routrschema import qs, opt
+import os
+import time
+import json
+import tempfile
+import hashlib
+import urllib2
+from collections import namedtuple
+from contextlib import closing
+
+from routr import route, GET, POST
+from routrschema import qs, json_body, opt
 from routr.exc import NoMatchFound
 from webob import Request, Response
-from webob.exc import HTTPError
+from webob.exc import HTTPError, HTTPBadRequest, HTTPGatewayTimeout
+import justext
 from . import Document
+from .fetch import Fetcher, fetch_many, read_body, detect_encoding
+from .metadata import read_metadata
+from .cache import LRUCache, SQLiteCache, TieredCache, SingleFlight
+from .image import configure_size_cache, extract_meta_image
+from .metrics import Timings, metrics, profile_slow
+from .utils import normalize_url
+
+__all__ = ('app', 'ResultCache', 'extract_fields', 'configure_result_cache')
+
+RESULT_CACHE_MAXSIZE = 10000
+RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+RESULT_CACHE_DB_MAXSIZE = 1000000
+# seconds results are served without asking upstream if page has changed,
+# unless its Cache-Control says otherwise
+RESULT_CACHE_TTL = 300
+# seconds results are kept for revalidation and by body hash
+RESULT_CACHE_STALE_TTL = 24 * 3600
+
+BATCH_MAX_URLS = 100
+# seconds batch results are waited for, at most BATCH_MAX_TIMEOUT
+BATCH_TIMEOUT = 30
+BATCH_MAX_TIMEOUT = 120
+# documents of a single batch fetched at once
+BATCH_CONCURRENCY = 8
+
+# read stoplists once at worker start rather than on the first request
+justext.preload_stoplists(['English'])
+
+# share probed image sizes between workers
+if os.environ.get('JAWS_IMAGE_SIZE_CACHE'):
+    configure_size_cache(os.environ['JAWS_IMAGE_SIZE_CACHE'])
+
+# requests taking at least this many seconds are profiled, their cProfile
+# stats are written to PROFILE_DIR
+PROFILE_SLOW = (float(os.environ['JAWS_PROFILE_SLOW'])
+    if os.environ.get('JAWS_PROFILE_SLOW') else None)
+PROFILE_DIR = os.environ.get('JAWS_PROFILE_DIR') or tempfile.gettempdir()
+
+# fields in order of extraction cost, html and text need justext analysis
+FIELDS = ('title', 'author', 'image', 'text', 'html')
+
+# fields which may be found in <head> alone, when only these are requested
+# they are looked up there first and the rest of the body isn't downloaded
+# unless some of them weren't found; title and author can't be among them as
+# they are cleaned up using the body
+_head_fields = {
+    'image': extract_meta_image,
+    }
+
+def extract_fields(data, url, encoding, fields):
+    """ Extract ``fields`` from HTML document ``data`` fetched from ``url``
+
+    Returns a dict of fields and :class:`jaws.metrics.Timings` of extraction.
+    """
+    doc = Document(data, url=url, encoding=encoding)
+    result = dict((field, getattr(doc, field)) for field in fields)
+    return result, doc.timings
+
+_Entry = namedtuple('_Entry', 'result etag last_modified fresh_until')
+
+def _sizeof(value):
+    result = getattr(value, 'result', value)
+    return 256 + sum(len(v) for v in result.values()
+        if isinstance(v, basestring))
+
+def _freshness(headers, ttl):
+    """ Return for how many seconds response with ``headers`` can be used
+    without revalidation, but no longer than ``ttl``, None if it can't be
+    stored in a shared cache"""
+    directives = {}
+    for directive in (headers.getheader('cache-control') or '').split(','):
+        name, _, value = directive.partition('=')
+        directives[name.strip().lower()] = value.strip(' "')
+    if 'no-store' in directives or 'private' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0
+    for name in ('s-maxage', 'max-age'):
+        if name in directives:
+            try:
+                return max(0, min(int(directives[name]), ttl))
+            except ValueError:
+                pass
+    return ttl
+
+class ResultCache(object):
+    """ Cache of extraction results
+
+    Results are looked up by URL and requested fields first. Once upstream
+    page may have changed, it is revalidated with a conditional request if
+    it had ETag or Last-Modified, otherwise refetched and results are looked
+    up by hash of its body, so only changed pages are extracted again.
+
+    :param max_bytes:
+        maximum size of results in each of two levels
+    :param ttl:
+        maximum number of seconds results are used without revalidation
+    :param stale_ttl:
+        number of seconds results are kept for revalidation and by body hash
+    :param extract:
+        function with the signature of :func:`extract_fields` doing the
+        extraction, e.g. in another process
+    :param path:
+        path to SQLite database sharing results between processes, they
+        also wait for each other instead of analysing the same document
+        at once
+    :param db_maxsize:
+        maximum number of results kept in the database
+
+    Timings of fetching and extraction are added to process' metrics, along
+    with hits and misses of its caches.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_MAXSIZE,
+            max_bytes=RESULT_CACHE_MAX_BYTES, ttl=RESULT_CACHE_TTL,
+            stale_ttl=RESULT_CACHE_STALE_TTL, fetcher=None,
+            extract=extract_fields, path=None,
+            db_maxsize=RESULT_CACHE_DB_MAXSIZE):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.fetcher = fetcher or Fetcher()
+        self.extract = extract
+        self.urls = LRUCache(maxsize, max_bytes=max_bytes, sizeof=_sizeof)
+        if path:
+            self.urls = TieredCache(self.urls,
+                SQLiteCache(path, max_entries=db_maxsize))
+        self.flights = SingleFlight(path and path + '.lock')
+        self.bodies = LRUCache(maxsize, ttl=stale_ttl, max_bytes=max_bytes,
+            sizeof=_sizeof)
+        metrics.add_cache('results', self.urls)
+        metrics.add_cache('bodies', self.bodies)
+
+    def analyse(self, url, fields):
+        """ Return dict with ``fields`` extracted from document at ``url``"""
+        key = '%s %s' % (','.join(fields), normalize_url(url))
+        entry = self.urls.get(key)
+        if entry is not None and entry.fresh_until > time.time():
+            return entry.result
+        # concurrent requests for the same document wait for the first one
+        return self.flights.do(key, self._analyse, url, key, fields)
+
+    def _analyse(self, url, key, fields):
+        # results may have been stored while waiting for another request
+        entry = self.urls.get(key)
+        if entry is not None and entry.fresh_until > time.time():
+            return entry.result
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        timings = Timings()
+        try:
+            try:
+                with timings.stage('fetch'):
+                    response = self.fetcher.open(url, headers=headers)
+            except urllib2.HTTPError as e:
+                with closing(e):
+                    if e.code != 304 or entry is None:
+                        raise
+                    self._store(key, entry.result, e.info(), entry)
+                    return entry.result
 
-__all__ = ('app',)
+            with closing(response):
+                result = self._extract(url, key, fields, response, timings)
+            self._store(key, result, response.info())
+            return result
+        finally:
+            metrics.observe(timings)
+
+    def _extract(self, url, key, fields, response, timings):
+        """ Extract ``fields`` reading no more of ``response`` than needed"""
+        info = response.info()
+        charset = info.getparam('charset')
+        store = 'no-store' not in (info.getheader('cache-control') or '')
+        max_size = self.fetcher.max_size
+        fields = sorted(fields, key=FIELDS.index)
+
+        data = ''
+        if fields and all(field in _head_fields for field in fields):
+            with timings.stage('read_metadata'):
+                data, metadata = read_metadata(response, max_size, charset)
+            head_key = ('head', hashlib.sha1(data).hexdigest(), key)
+            result = self.bodies.get(head_key)
+            if result is not None:
+                return result
+            result = {}
+            for field in fields:
+                result[field] = _head_fields[field](metadata, url)
+                if result[field] is None:
+                    break
+            else:
+                if store:
+                    self.bodies.set(head_key, result)
+                return result
+
+        if not max_size or len(data) < max_size:
+            with timings.stage('read'):
+                data += read_body(response,
+                    max_size and max_size - len(data))
+        # done with upstream, let other requests to its host proceed
+        response.close()
+        body_key = (hashlib.sha1(data).hexdigest(), key)
+        result = self.bodies.get(body_key)
+        if result is None:
+            with timings.stage('detect_encoding'):
+                encoding = detect_encoding(data, charset)
+            # includes passing data to and from extraction process, if any
+            with timings.stage('extract'):
+                result, extract_timings = self.extract(
+                    data, url, encoding, fields)
+            timings.update(extract_timings)
+            if store:
+                self.bodies.set(body_key, result)
+        return result
+
+    def _store(self, key, result, headers, previous=None):
+        freshness = _freshness(headers, self.ttl)
+        if freshness is None:
+            self.urls.delete(key)
+            return
+        etag = headers.getheader('etag')
+        last_modified = headers.getheader('last-modified')
+        if previous is not None:
+            # 304 responses don't have to repeat validators
+            etag = etag or previous.etag
+            last_modified = last_modified or previous.last_modified
+        ttl = self.stale_ttl if etag or last_modified else freshness
+        entry = _Entry(result, etag, last_modified, time.time() + freshness)
+        self.urls.set(key, entry, ttl=max(ttl, freshness))
+
+# share results between workers, which then also coalesce requests
+result_cache = ResultCache(path=os.environ.get('JAWS_RESULT_CACHE'))
+
+def configure_result_cache(**kwargs):
+    """ Replace result cache used by the application, keyword arguments are
+    passed to :class:`ResultCache`"""
+    global result_cache
+    kwargs.setdefault('path', os.environ.get('JAWS_RESULT_CACHE'))
+    result_cache = ResultCache(**kwargs)
+    return result_cache
 
 def analyse(url=None, html=False, text=False, image=False, author=False,
         title=False):
-    doc = Document.from_url(url)
-    result = {}
-    if html:
-        result['html'] = doc.html
-    if text:
-        result['text'] = doc.text
-    if image:
-        result['image'] = doc.image
-    if author:
-        result['author'] = doc.author
-    if title:
-        result['title'] = doc.title
-    return result
+    requested = {
+        'html': html,
+        'text': text,
+        'image': image,
+        'author': author,
+        'title': title,
+        }
+    fields = tuple(field for field in FIELDS if requested[field])
+    return dict(result_cache.analyse(url, fields))
 
 def analyse_html(url=None):
-    doc = Document.from_url(url)
-    return Response(doc.html)
+    return Response(result_cache.analyse(url, ('html',))['html'])
+
+def _fields(names):
+    """ Validate list of field names, return them in order of ``FIELDS``"""
+    unknown = set(names) - set(FIELDS)
+    if unknown:
+        raise ValueError('unknown fields: %s' % ', '.join(sorted(unknown)))
+    return tuple(field for field in FIELDS if field in names)
+
+def analyse_batch(params):
+    """ Analyse many documents at once
+
+    Results are streamed as JSON lines in order of completion, each with
+    ``index`` of its item in ``urls``. Duplicate URLs are fetched once and
+    items not done within ``timeout`` seconds get an error.
+    """
+    items = params['urls']
+    if len(items) > BATCH_MAX_URLS:
+        raise HTTPBadRequest('at most %d urls are allowed' % BATCH_MAX_URLS)
+    timeout = min(params['timeout'], BATCH_MAX_TIMEOUT)
+
+    # items by normalized URL, each URL is analysed once for all their fields
+    indexes = {}
+    urls = {}
+    fields = {}
+    for index, item in enumerate(items):
+        key = normalize_url(item['url'])
+        indexes.setdefault(key, []).append(index)
+        urls.setdefault(key, item['url'])
+        fields[key] = fields.get(key, ()) + item.get('fields', params['fields'])
+
+    def _analyse(key):
+        return result_cache.analyse(urls[key], _fields(fields[key]))
+
+    def _line(index, result):
+        item = items[index]
+        line = {'index': index, 'url': item['url']}
+        if isinstance(result, Exception):
+            line['error'] = '%s: %s' % (result.__class__.__name__, result)
+        else:
+            for field in item.get('fields', params['fields']):
+                line[field] = result[field]
+        return json.dumps(line) + '\n'
+
+    def _lines():
+        pending = set(indexes)
+        for key, result in fetch_many(list(indexes), _analyse,
+                BATCH_CONCURRENCY, timeout):
+            pending.discard(key)
+            for index in indexes[key]:
+                yield _line(index, result)
+        error = HTTPGatewayTimeout('not done within %s seconds' % timeout)
+        for index in sorted(i for key in pending for i in indexes[key]):
+            yield _line(index, error)
+
+    return Response(app_iter=_lines(), content_type='application/x-ndjson')
+
+def metrics_view():
+    return Response(metrics.render(),
+        content_type='text/plain; version=0.0.4', charset='utf-8')
 
 routes = route(
     GET('/analyse', qs(
@@ -45,10 +350,16 @@ routes = route(
         ),
         analyse),
     GET('/analyse.html', qs(url=str), analyse_html),
+    POST('/analyse/batch', json_body(
+            urls=[{'url': str, 'fields': opt(_fields)}],
+            fields=opt(_fields, ()),
+            timeout=opt(float, BATCH_TIMEOUT),
+        ),
+        analyse_batch),
+    GET('/metrics', metrics_view),
     )
 
-def app(environ, start_response):
-    request = Request(environ)
+def _respond(request):
     try:
         tr = routes(request)
         response = tr.target(*tr.args, **tr.kwargs)
@@ -58,4 +369,17 @@ def app(environ, start_response):
         response = e
     if not isinstance(response, Response):
         response = Response(json=response)
+    return response
+
+def app(environ, start_response):
+    request = Request(environ)
+    timings = Timings()
+    # streamed responses are only timed until they start
+    with timings.stage('request'):
+        if PROFILE_SLOW is None:
+            response = _respond(request)
+        else:
+            with profile_slow(PROFILE_SLOW, PROFILE_DIR, request.path_info):
+                response = _respond(request)
+    metrics.observe(timings)
     return response(environ, start_response)
@@ -6,10 +6,11 @@
 """
 
 import re
+import urlparse
 import dateutil.parser
 
-__all__ = ('zn2', 'matches_attr', 'gen_matches_any', 'depth_first',
-        'try_parse_timestamp', 'precedings')
+__all__ = ('zn2', 'gen_matches_any', 'AttrClassifier', 'depth_first',
+        'try_parse_timestamp', 'precedings', 'normalize_url')
 
 _zn2_re = re.compile(r'[^a-z0-9]', re.I)
 def zn2(v):
@@ -17,14 +18,49 @@ def zn2(v):
 
 def gen_matches_any(*p):
     """ Generate regexp for matching against any of the parts ``p``"""
-    return re.compile('|'.join('(%s)' % v for v in p), re.I)
+    return re.compile('|'.join('(?:%s)' % v for v in p), re.I)
 
-def matches_attr(p, e, *attrs):
-    """ Check if element ``e`` has any of the ``attrs`` matches ``p``"""
-    for attr in attrs:
-        if attr in e.attrib and p.search(e.attrib[attr]):
-            return True
-    return False
+class AttrClassifier(object):
+    """ Match class and id of elements against several families of patterns
+    at once
+
+    ``families`` are ``(bit, patterns)`` pairs, :meth:`classify` returns a
+    mask of bits of families which match class or id of an element, a family
+    matches as :func:`gen_matches_any` of its patterns would. Masks are
+    cached by class and id, so classifying an element again, or its copy, is
+    a dict lookup.
+    """
+
+    cache_size = 10000
+
+    def __init__(self, families):
+        self._bits = []
+        branches = []
+        for n, (bit, patterns) in enumerate(families):
+            name = 'f%d' % n
+            self._bits.append((name, bit))
+            # the lookahead searches the whole value for the family, groups
+            # of families which didn't match are left unset
+            branches.append('(?:(?=.*?(?P<%s>%s))|)' % (
+                name, '|'.join('(?:%s)' % v for v in patterns)))
+        self._re = re.compile(''.join(branches), re.I | re.S)
+        self._masks = {}
+
+    def classify(self, e):
+        key = (e.get('class'), e.get('id'))
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = 0
+            for value in key:
+                if value is not None:
+                    m = self._re.match(value)
+                    for name, bit in self._bits:
+                        if m.group(name) is not None:
+                            mask |= bit
+            if len(self._masks) >= self.cache_size:
+                self._masks.clear()
+            self._masks[key] = mask
+        return mask
 
 def depth_first(element, skip=None):
     """ Traverse tree in depth-first manner"""
@@ -34,6 +70,22 @@ def depth_first(element, skip=None):
             for el in depth_first(ch, skip=skip):
                 yield el
 
+_default_ports = {'http': 80, 'https': 443}
+def normalize_url(url):
+    """ Normalize ``url`` so it can be used as a cache key
+
+    Scheme and host are lowercased, default port and fragment are dropped.
+    """
+    parts = urlparse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    netloc = (parts.hostname or '').lower()
+    if parts.username is not None:
+        netloc = parts.netloc.rsplit('@', 1)[0] + '@' + netloc
+    if parts.port and parts.port != _default_ports.get(scheme):
+        netloc += ':%d' % parts.port
+    return urlparse.urlunsplit(
+        (scheme, netloc, parts.path or '/', parts.query, ''))
+
 def try_parse_timestamp(v):
     try:
         return dateutil.parser.parse(v)
@@ -0,0 +1,185 @@
+"""
+
+    jaws.warc -- reading documents from WARC and ARC archives
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import re
+import gzip
+import zlib
+from collections import namedtuple
+from mimetools import Message
+from cStringIO import StringIO
+
+__all__ = ('Record', 'read_records', 'open_archive', 'iter_records')
+
+CHUNK_SIZE = 64 * 1024
+MAX_PAYLOAD_SIZE = 10 * 1024 * 1024
+CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+
+# ``payload`` is HTTP response body with transfer and content encodings
+# removed, ``charset`` is taken from its Content-Type header
+Record = namedtuple('Record', 'url date status content_type charset payload')
+
+def open_archive(filename):
+    """ Open WARC or ARC file, gzipped or not"""
+    f = open(filename, 'rb')
+    magic = f.read(2)
+    f.seek(0)
+    if magic == '\x1f\x8b':
+        # concatenated gzip members, one per record, are read as one stream
+        return gzip.GzipFile(fileobj=f, mode='rb')
+    return f
+
+def read_records(f, content_types=CONTENT_TYPES, url_pattern=None,
+        max_size=MAX_PAYLOAD_SIZE):
+    """ Read HTTP responses from WARC or ARC file object ``f``
+
+    Records are read one by one, payloads of records which don't match
+    ``content_types`` or ``url_pattern`` are skipped without keeping them in
+    memory and payloads are truncated at ``max_size`` bytes, both as stored
+    and once decompressed.
+    """
+    if isinstance(url_pattern, basestring):
+        url_pattern = re.compile(url_pattern)
+    line = _skip_blank(f)
+    if line.startswith('WARC/'):
+        records = _read_warc(f, line)
+    elif line.startswith('filedesc://'):
+        records = _read_arc(f, line)
+    elif not line:
+        return
+    else:
+        raise ValueError('not a WARC or ARC file')
+
+    for (url, date, block) in records:
+        if url_pattern and not url_pattern.search(url):
+            block.skip()
+            continue
+        status, headers = _read_http_headers(block)
+        if status is None or status >= 300 or (content_types
+                and headers.gettype() not in content_types):
+            block.skip()
+            continue
+        payload = block.read(max_size)
+        block.skip()
+        yield Record(url, date, status, headers.gettype(),
+            headers.getparam('charset'),
+            _decode_payload(payload, headers, max_size))
+
+def iter_records(filenames, **kwargs):
+    """ Read records from archives at ``filenames``, keyword arguments are
+    passed to :func:`read_records`"""
+    for filename in filenames:
+        f = open_archive(filename)
+        try:
+            for record in read_records(f, **kwargs):
+                yield record
+        finally:
+            f.close()
+
+class _Block(object):
+    """ Length-limited view of record's content"""
+
+    def __init__(self, f, length):
+        self.f = f
+        self.remaining = length
+
+    def readline(self):
+        line = self.f.readline(self.remaining)
+        self.remaining -= len(line)
+        return line
+
+    def read(self, size=None):
+        if size is None or size > self.remaining:
+            size = self.remaining
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def skip(self):
+        while self.remaining > 0:
+            if not self.read(CHUNK_SIZE):
+                break
+
+def _skip_blank(f):
+    line = f.readline()
+    while line and not line.strip():
+        line = f.readline()
+    return line
+
+def _read_warc(f, line):
+    while line.startswith('WARC/'):
+        headers = Message(f, seekable=0)
+        block = _Block(f, int(headers.get('content-length', 0)))
+        if headers.get('warc-type') == 'response':
+            yield (headers.get('warc-target-uri', '').strip('<>'),
+                headers.get('warc-date'), block)
+        block.skip()
+        line = _skip_blank(f)
+
+def _read_arc(f, line):
+    # version block of the file
+    _Block(f, int(line.split()[-1])).skip()
+    line = _skip_blank(f)
+    while line:
+        fields = line.split()
+        block = _Block(f, int(fields[-1]))
+        yield (fields[0], fields[2], block)
+        block.skip()
+        line = _skip_blank(f)
+
+def _read_http_headers(block):
+    status_line = block.readline()
+    parts = status_line.split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+        return None, None
+    try:
+        status = int(parts[1])
+    except ValueError:
+        return None, None
+    lines = []
+    while True:
+        line = block.readline()
+        if not line.strip():
+            break
+        lines.append(line)
+    return status, Message(StringIO(''.join(lines)), seekable=0)
+
+def _decode_payload(payload, headers, max_size=None):
+    if 'chunked' in (headers.get('transfer-encoding') or '').lower():
+        payload = _dechunk(payload)
+    encoding = (headers.get('content-encoding') or '').lower()
+    if encoding in ('gzip', 'x-gzip', 'deflate'):
+        wbits = 16 + zlib.MAX_WBITS if 'gzip' in encoding else zlib.MAX_WBITS
+        try:
+            # the rest of a payload inflating beyond max_size is dropped
+            payload = zlib.decompressobj(wbits).decompress(
+                payload, max_size or 0)
+        except zlib.error:
+            pass
+    return payload
+
+def _dechunk(data):
+    chunks = []
+    pos = 0
+    while pos < len(data):
+        end = data.find('\n', pos)
+        if end == -1:
+            break
+        try:
+            size = int(data[pos:end].split(';')[0].strip(), 16)
+        except ValueError:
+            # not chunked after all
+            return data
+        if size == 0:
+            break
+        chunks.append(data[end + 1:end + 1 + size])
+        pos = end + 1 + size
+        # chunk data is followed by CRLF
+        if data[pos:pos + 2] == '\r\n':
+            pos += 2
+        elif data[pos:pos + 1] == '\n':
+            pos += 1
+    return ''.join(chunks)
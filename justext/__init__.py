@@ -4,7 +4,9 @@
 # This software is licensed as described in the file COPYING, which
 # you should have received as part of this distribution.
 
-from justext.core import justext, get_stoplists, get_stoplist, main
+from justext.core import justext, get_stoplists, get_stoplist, load_stoplist, \
+        preload_stoplists, list_elements, parse_html, parse_html_file, \
+        Paragraph, main
 
 try:
     __version__ = __import__('pkg_resources').get_distribution('justext').version
@@ -5,11 +5,14 @@
 # you should have received as part of this distribution.
 
 import codecs
+import mmap
 import os
 import pkgutil
 import re
 import sys
+import threading
 
+from collections import OrderedDict
 from xml.sax.handler import ContentHandler
 
 import lxml.etree
@@ -31,6 +34,16 @@ PARAGRAPH_TAGS = ['blockquote', 'caption', 'center', 'col', 'colgroup', 'dd',
         'ul', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']
 DEFAULT_ENCODING = 'utf-8'
 DEFAULT_ENC_ERRORS = 'replace'
+# Encoding declared in <meta> tags is only looked for in the first SNIFF_SIZE
+# bytes, pages are fed to the parser CHUNK_SIZE bytes at a time.
+SNIFF_SIZE = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+# Maximum number of stoplists kept in memory, enough for all inbuilt ones.
+STOPLIST_CACHE_SIZE = 128
+# Paragraph classes are stored as integer codes, CLASSES maps them to names.
+BAD, GOOD, NEARGOOD, SHORT = range(4)
+CLASSES = ('bad', 'good', 'neargood', 'short')
+CLASS_CODES = dict((name, code) for code, name in enumerate(CLASSES))
 
 class JustextError(Exception):
     """Base class for jusText exceptions."""
@@ -48,34 +61,86 @@ def get_stoplists():
             stoplists.append(filename.rsplit('.', 1)[0])
     return stoplists
 
-def get_stoplist(language):
-    """ Returns an inbuilt stoplist for the language as a set of words."""
-    stoplist_contents = pkgutil.get_data('justext',
-        os.path.join('stoplists', language + '.txt'))
-    return set([unicode(l.strip(), 'utf-8') for l in stoplist_contents.split('\n')])
+_stoplists = OrderedDict()
+_stoplists_lock = threading.Lock()
 
-def decode_html(html_string, encoding=None, default_encoding=DEFAULT_ENCODING,
-        errors=DEFAULT_ENC_ERRORS):
-    """ Converts a string containing an HTML page (html_string) into unicode.
-    Tries to guess character encoding from meta tags.
+def _cached_stoplist(key, version, load):
+    """ Returns stoplist cached under key, calls load to (re)load it if it
+    isn't cached yet or if it was cached with a different version. Least
+    recently used stoplists are evicted when there are more than
+    STOPLIST_CACHE_SIZE of them.
     """
-    if encoding:
-        return unicode(html_string, encoding, errors=errors)
-    re_meta1 = re.compile('''<meta\s+http-equiv=['"]?content-type['"]?\s+content=['"]?[^'"]*charset=([^'"]+)''', re.I)
-    re_meta2 = re.compile('''<meta\s+content=['"]?[^'"]*charset=([^'"]+)['"]?\s+http-equiv=['"]?content-type['"]?''', re.I)
-    re_meta3 = re.compile('''<meta\s+http-equiv=['"]?charset['"]?\s+content=['"]?([^'"]+)''', re.I)
-    re_meta4 = re.compile('''<meta\s+content=['"]?([^'"]+)['"]?\s+http-equiv=['"]?charset['"]?''', re.I)
-    re_meta5 = re.compile('''<meta\s+charset=['"]?([^'"]+)''', re.I)
-    for re_meta in (re_meta1, re_meta2, re_meta3, re_meta4, re_meta5):
+    with _stoplists_lock:
+        cached = _stoplists.pop(key, None)
+        if cached is None or cached[0] != version:
+            cached = (version, frozenset(load()))
+        _stoplists[key] = cached
+        while len(_stoplists) > STOPLIST_CACHE_SIZE:
+            _stoplists.popitem(last=False)
+        return cached[1]
+
+def get_stoplist(language):
+    """ Returns an inbuilt stoplist for the language as a frozenset of words.
+    Each stoplist is read only once per process and shared by all callers.
+    """
+    def load():
+        stoplist_contents = pkgutil.get_data('justext',
+            os.path.join('stoplists', language + '.txt'))
+        return [unicode(l.strip(), 'utf-8') for l in stoplist_contents.split('\n')]
+    return _cached_stoplist(('language', language), None, load)
+
+def load_stoplist(path):
+    """ Returns a stoplist read from file at path (the most frequent words, one
+    per line, in utf-8 encoding) as a frozenset of words. The stoplist is cached
+    and read again only if the file modification time changes.
+    """
+    path = os.path.abspath(path)
+    def load():
+        with codecs.open(path, 'r', 'utf-8') as fp_stoplist:
+            return [l.strip() for l in fp_stoplist]
+    return _cached_stoplist(('path', path), os.stat(path).st_mtime, load)
+
+def preload_stoplists(languages=None):
+    """ Loads inbuilt stoplists for languages (all of them by default) into the
+    cache, e.g. at worker start.
+    """
+    for language in languages or get_stoplists():
+        get_stoplist(language)
+
+_meta_encoding_res = (
+    re.compile('''<meta\s+http-equiv=['"]?content-type['"]?\s+content=['"]?[^'"]*charset=([^'"]+)''', re.I),
+    re.compile('''<meta\s+content=['"]?[^'"]*charset=([^'"]+)['"]?\s+http-equiv=['"]?content-type['"]?''', re.I),
+    re.compile('''<meta\s+http-equiv=['"]?charset['"]?\s+content=['"]?([^'"]+)''', re.I),
+    re.compile('''<meta\s+content=['"]?([^'"]+)['"]?\s+http-equiv=['"]?charset['"]?''', re.I),
+    re.compile('''<meta\s+charset=['"]?([^'"]+)''', re.I),
+    )
+
+def find_meta_encoding(html_string):
+    """ Returns the character encoding declared in meta tags of html_string or
+    None. Encodings unknown to Python are skipped.
+    """
+    for re_meta in _meta_encoding_res:
         m = re_meta.search(html_string)
         if m:
             meta_encoding = m.group(1)
             try:
-                return unicode(html_string, meta_encoding, errors=errors)
+                codecs.lookup(meta_encoding)
             except LookupError:
                 # if the encoding specified in <meta> is unknown
                 # proceed as if it wasn't found at all
-                pass
+                continue
+            return meta_encoding
+
+def decode_html(html_string, encoding=None, default_encoding=DEFAULT_ENCODING,
+        errors=DEFAULT_ENC_ERRORS):
+    """ Converts a string containing an HTML page (html_string) into unicode.
+    Tries to guess character encoding from meta tags.
+    """
+    if encoding:
+        return unicode(html_string, encoding, errors=errors)
+    meta_encoding = find_meta_encoding(html_string[:SNIFF_SIZE])
+    if meta_encoding:
+        return unicode(html_string, meta_encoding, errors=errors)
     try:
         # if unknown encoding, try utf-8 first
         return unicode(html_string, 'utf-8', errors='strict')
@@ -87,6 +152,82 @@ def decode_html(html_string, encoding=None, default_encoding=DEFAULT_ENCODING,
             raise JustextError('Unable to convert the HTML to unicode from %s: %s' % (
                 default_encoding, e))
 
+def is_utf8(html_string, chunk_size=CHUNK_SIZE):
+    """ Checks if html_string (a string or a memory map) is valid utf-8
+    without decoding all of it at once.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')('strict')
+    try:
+        for pos in xrange(0, len(html_string), chunk_size):
+            decoder.decode(html_string[pos:pos + chunk_size])
+        decoder.decode('', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+def map_file(path):
+    """ Returns read-only memory map of the file at path, an empty string for
+    empty files which can't be mapped.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def feed_parser(parser, data, chunk_size=CHUNK_SIZE):
+    """ Parses data (a string or a memory map) with lxml parser feeding it in
+    chunks and returns the root element.
+    """
+    for pos in xrange(0, len(data), chunk_size):
+        parser.feed(data[pos:pos + chunk_size])
+    return parser.close()
+
+def parse_html(html_string, encoding=None, default_encoding=DEFAULT_ENCODING,
+        errors=DEFAULT_ENC_ERRORS, chunk_size=CHUNK_SIZE):
+    """ Parses an HTML page given as a string or a memory map into a tree.
+    Character encoding is determined the same way decode_html does it but
+    the page is never decoded as a whole: utf-8 pages are fed to the parser
+    as they are, others are converted to utf-8 chunk by chunk.
+    """
+    if not len(html_string):
+        # let lxml complain about empty document the usual way
+        return lxml.html.fromstring(html_string)
+    if not encoding:
+        encoding = find_meta_encoding(html_string[:SNIFF_SIZE])
+    utf8 = None
+    if not encoding:
+        utf8 = is_utf8(html_string, chunk_size)
+        encoding = 'utf-8' if utf8 else default_encoding
+    parser = lxml.html.HTMLParser(encoding='utf-8')
+    if codecs.lookup(encoding).name == 'utf-8':
+        if utf8 is None:
+            utf8 = is_utf8(html_string, chunk_size)
+        if utf8:
+            return feed_parser(parser, html_string, chunk_size)
+
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    try:
+        for pos in xrange(0, len(html_string), chunk_size):
+            chunk = decoder.decode(html_string[pos:pos + chunk_size])
+            parser.feed(chunk.encode('utf-8'))
+        parser.feed(decoder.decode('', final=True).encode('utf-8'))
+    except UnicodeDecodeError, e:
+        raise JustextError('Unable to convert the HTML to unicode from %s: %s' % (
+            encoding, e))
+    return parser.close()
+
+def parse_html_file(path, encoding=None, default_encoding=DEFAULT_ENCODING,
+        errors=DEFAULT_ENC_ERRORS):
+    """ Parses an HTML file into a tree, see parse_html. The file is memory
+    mapped rather than read into memory.
+    """
+    data = map_file(path)
+    try:
+        return parse_html(data, encoding, default_encoding, errors)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+
 decode_entities_pp_trans = {
     ord(u'\x83'): u'\u0192',
     ord(u'\x84'): u'\u201e',
@@ -139,6 +280,10 @@ def remove_non_content(root):
         if el.getparent() is not None:
             el.drop_tree()
 
+_whitespace_re = re.compile("\s+")
+_heading_re = re.compile('(^h\d|\.h\d)')
+_select_re = re.compile('(^select|\.select)')
+
 class XPathPart(object):
 
     def __init__(self, name, idx):
@@ -154,48 +299,112 @@ class XPathPart(object):
         self.children[name] = idx
         return XPathPart(name, idx)
 
+class Paragraph(object):
+    """ A paragraph of text, see justext for the description of attributes.
+
+    The classes are kept as integer codes in cls and cfcls attributes. Item
+    access is supported for compatibility with the dictionaries paragraphs
+    used to be, paragraph['class'] and paragraph['cfclass'] give class names.
+    """
+
+    __slots__ = ('dom_path', 'node', 'xpath', 'text_nodes', 'text',
+        'word_count', 'linked_char_count', 'tag_count', 'stopword_count',
+        'stopword_density', 'link_density', 'heading', 'cfcls', 'cls')
+
+    # dictionary keys to attributes
+    _keys = dict((attr, attr) for attr in __slots__)
+    del _keys['cls'], _keys['cfcls']
+    _keys.update({'class': 'cls', 'cfclass': 'cfcls'})
+
+    def __init__(self, dom_path, node, xpath=None):
+        self.dom_path = dom_path
+        self.node = node
+        if xpath is not None:
+            self.xpath = xpath
+        self.text_nodes = []
+        self.word_count = 0
+        self.linked_char_count = 0
+        self.tag_count = 0
+
+    def __getitem__(self, key):
+        try:
+            value = getattr(self, self._keys[key])
+        except AttributeError:
+            raise KeyError(key)
+        if key == 'class' or key == 'cfclass':
+            return CLASSES[value]
+        return value
+
+    def __setitem__(self, key, value):
+        if key == 'class' or key == 'cfclass':
+            value = CLASS_CODES[value]
+        setattr(self, self._keys[key], value)
+
+    def __contains__(self, key):
+        return key in self._keys and hasattr(self, self._keys[key])
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [key for key, attr in sorted(self._keys.items())
+            if hasattr(self, attr)]
+
+    def __repr__(self):
+        return '<Paragraph %r>' % dict((k, self[k]) for k in self.keys())
+
 class SaxPragraphMaker(ContentHandler):
     """ A class for converting a HTML page represented as a DOM object into a list
     of paragraphs.
     """
 
-    def __init__(self):
+    def __init__(self, xpaths=True):
         self.dom = []
+        self.paragraph_tags = frozenset(PARAGRAPH_TAGS)
+        self.xpaths = xpaths
         self.xpath = []
+        self.nodes = []
+        self.node_count = 0
         self.paragraphs = []
-        self.paragraph = {}
+        self.paragraph = None
         self.link = False
         self.br = False
         self._start_new_pragraph()
 
     def _start_new_pragraph(self):
-        if self.paragraph and self.paragraph['text_nodes'] != []:
-            self.paragraph['text'] = re.sub("\s+", " ", (
-                ''.join(self.paragraph['text_nodes']))).strip()
+        if self.paragraph and self.paragraph.text_nodes != []:
+            # text nodes are already normalized, only the joints may
+            # produce double spaces
+            self.paragraph.text = ''.join(
+                self.paragraph.text_nodes).replace('  ', ' ').strip()
             self.paragraphs.append(self.paragraph)
-        self.paragraph = {
-            'dom_path': '.'.join(self.dom),
-            'xpath': '/' + '/'.join(
-                '%s[%d]' % (x.name, x.idx) for x in self.xpath),
-            'text_nodes': [],
-            'word_count': 0,
-            'linked_char_count': 0,
-            'tag_count': 0,
-        }
+        if self.xpaths:
+            xpath = '/' + '/'.join(
+                '%s[%d]' % (x.name, x.idx) for x in self.xpath)
+        else:
+            xpath = None
+        self.paragraph = Paragraph('.'.join(self.dom),
+            self.nodes[-1] if self.nodes else None, xpath)
 
     def startElementNS(self, name, qname, attrs):
         dummy_uri, name = name
         self.dom.append(name)
-        if self.xpath:
-            self.xpath.append(self.xpath[-1].next(name))
-        else:
-            self.xpath.append(XPathPart(name, 1))
-        if name in PARAGRAPH_TAGS or (name == 'br' and self.br):
+        self.nodes.append(self.node_count)
+        self.node_count += 1
+        if self.xpaths:
+            if self.xpath:
+                self.xpath.append(self.xpath[-1].next(name))
+            else:
+                self.xpath.append(XPathPart(name, 1))
+        if name in self.paragraph_tags or (name == 'br' and self.br):
             if name == 'br':
                 # the <br><br> is a paragraph separator and should
                 # not be included in the number of tags within the
                 # paragraph
-                self.paragraph['tag_count'] -= 1
+                self.paragraph.tag_count -= 1
             self._start_new_pragraph()
         else:
             if name == 'br':
@@ -204,13 +413,15 @@ class SaxPragraphMaker(ContentHandler):
                 self.br = False
             if name == 'a':
                 self.link = True
-            self.paragraph['tag_count'] += 1
+            self.paragraph.tag_count += 1
 
     def endElementNS(self, name, qname):
         dummy_uri, name = name
         self.dom.pop()
-        self.xpath.pop()
-        if name in PARAGRAPH_TAGS:
+        self.nodes.pop()
+        if self.xpaths:
+            self.xpath.pop()
+        if name in self.paragraph_tags:
             self._start_new_pragraph()
         if name == 'a':
             self.link = False
@@ -221,17 +432,120 @@ class SaxPragraphMaker(ContentHandler):
     def characters(self, content):
         if content.strip() == '':
             return
-        text = re.sub("\s+", " ", content)
-        self.paragraph['text_nodes'].append(text)
+        text = _whitespace_re.sub(" ", content)
+        self.paragraph.text_nodes.append(text)
         words = text.strip().split()
-        self.paragraph['word_count'] += len(words)
+        self.paragraph.word_count += len(words)
         if self.link:
-            self.paragraph['linked_char_count'] += len(text)
+            self.paragraph.linked_char_count += len(text)
         self.br = False
 
-def make_paragraphs(root):
-    """Converts DOM into paragraphs."""
-    handler = SaxPragraphMaker()
+def list_elements(root):
+    """ Returns a list of elements of the tree rooted at root in document
+    order, paragraph's node attribute is an index into this list.
+    """
+    return list(root.iter(lxml.etree.Element))
+
+def walk_paragraphs(root, xpaths=True):
+    """ Converts DOM into paragraphs by walking the tree directly. Produces
+    the same paragraphs as SaxPragraphMaker does but without the overhead of
+    SAX events.
+    """
+    paragraph_tags = frozenset(PARAGRAPH_TAGS)
+    paragraphs = []
+    dom = []
+    nodes = []
+    xpath = []
+    elements = []
+    children = [iter((root,))]
+    node_count = 0
+    link = False
+    br = False
+
+    def start_new_paragraph(paragraph):
+        if paragraph is not None and paragraph.text_nodes != []:
+            # text nodes are already normalized, only the joints may
+            # produce double spaces
+            paragraph.text = ''.join(
+                paragraph.text_nodes).replace('  ', ' ').strip()
+            paragraphs.append(paragraph)
+        if xpaths:
+            path = '/' + '/'.join('%s[%d]' % (x.name, x.idx) for x in xpath)
+        else:
+            path = None
+        return Paragraph('.'.join(dom), nodes[-1] if nodes else None, path)
+
+    paragraph = start_new_paragraph(None)
+    while children:
+        el = next(children[-1], None)
+        if el is None:
+            # end of element
+            children.pop()
+            if not elements:
+                continue
+            el = elements.pop()
+            name = dom.pop()
+            nodes.pop()
+            if xpaths:
+                xpath.pop()
+            if name in paragraph_tags:
+                paragraph = start_new_paragraph(paragraph)
+            if name == 'a':
+                link = False
+            content = el.tail
+        elif isinstance(el.tag, basestring):
+            # start of element
+            name = el.tag
+            if name[0] == '{':
+                name = name.split('}', 1)[1]
+            dom.append(name)
+            nodes.append(node_count)
+            node_count += 1
+            if xpaths:
+                if xpath:
+                    xpath.append(xpath[-1].next(name))
+                else:
+                    xpath.append(XPathPart(name, 1))
+            if name in paragraph_tags or (name == 'br' and br):
+                if name == 'br':
+                    # the <br><br> is a paragraph separator and should
+                    # not be included in the number of tags within the
+                    # paragraph
+                    paragraph.tag_count -= 1
+                paragraph = start_new_paragraph(paragraph)
+            else:
+                br = name == 'br'
+                if name == 'a':
+                    link = True
+                paragraph.tag_count += 1
+            elements.append(el)
+            children.append(iter(el))
+            content = el.text
+        else:
+            # comments and processing instructions contribute their tails only
+            content = el.tail
+
+        if not content or content.strip() == '':
+            continue
+        text = _whitespace_re.sub(" ", content)
+        paragraph.text_nodes.append(text)
+        paragraph.word_count += len(text.split())
+        if link:
+            paragraph.linked_char_count += len(text)
+        br = False
+
+    start_new_paragraph(paragraph)
+    return paragraphs
+
+def make_paragraphs(root, xpaths=True, sax=True):
+    """Converts DOM into paragraphs. If xpaths is False, paragraphs refer to
+    their elements only by node index (see list_elements) and no XPath
+    expressions are built. If sax is False, the tree is walked directly instead
+    of being converted to SAX events by lxml.sax (see walk_paragraphs).
+    """
+    if not sax:
+        return walk_paragraphs(root, xpaths)
+    handler = SaxPragraphMaker(xpaths=xpaths)
     lxml.sax.saxify(root, handler)
     return handler.paragraphs
 
@@ -240,146 +554,183 @@ def classify_paragraphs(paragraphs, stoplist, length_low=LENGTH_LOW_DEFAULT,
         stopwords_high=STOPWORDS_HIGH_DEFAULT, max_link_density=MAX_LINK_DENSITY_DEFAULT,
         no_headings=NO_HEADINGS_DEFAULT):
     """Context-free pragraph classification."""
+    # paragraphs mostly share a handful of dom paths, so the heading and
+    # select checks are done once per distinct dom path
+    dom_paths = {}
     for paragraph in paragraphs:
-        length = len(paragraph['text'])
+        text = paragraph.text
+        length = len(text)
         stopword_count = 0
-        for word in paragraph['text'].split():
+        for word in text.split():
             if word in stoplist:
                 stopword_count += 1
-        word_count = paragraph['word_count']
+        word_count = paragraph.word_count
         if word_count == 0:
             stopword_density = 0
             link_density = 0
         else:
             stopword_density = 1.0 * stopword_count / word_count
-            link_density = float(paragraph['linked_char_count']) / length
-        paragraph['stopword_count'] = stopword_count
-        paragraph['stopword_density'] = stopword_density
-        paragraph['link_density'] = link_density
+            link_density = float(paragraph.linked_char_count) / length
+        paragraph.stopword_count = stopword_count
+        paragraph.stopword_density = stopword_density
+        paragraph.link_density = link_density
 
-        paragraph['heading'] = bool(not no_headings and re.search('(^h\d|\.h\d)', paragraph['dom_path']))
+        dom_path = paragraph.dom_path
+        try:
+            heading, select = dom_paths[dom_path]
+        except KeyError:
+            heading, select = dom_paths[dom_path] = (
+                bool(not no_headings and _heading_re.search(dom_path)),
+                bool(_select_re.search(dom_path)))
+        paragraph.heading = heading
         if link_density > max_link_density:
-            paragraph['cfclass'] = 'bad'
-        elif (u'\xa9' in paragraph['text']) or ('&copy' in paragraph['text']):
-            paragraph['cfclass'] = 'bad'
-        elif re.search('(^select|\.select)', paragraph['dom_path']):
-            paragraph['cfclass'] = 'bad'
+            paragraph.cfcls = BAD
+        elif (u'\xa9' in text) or ('&copy' in text):
+            paragraph.cfcls = BAD
+        elif select:
+            paragraph.cfcls = BAD
         else:
             if length < length_low:
-                if paragraph['linked_char_count'] > 0:
-                    paragraph['cfclass'] = 'bad'
+                if paragraph.linked_char_count > 0:
+                    paragraph.cfcls = BAD
                 else:
-                    paragraph['cfclass'] = 'short'
+                    paragraph.cfcls = SHORT
             else:
                 if stopword_density >= stopwords_high:
                     if length > length_high:
-                        paragraph['cfclass'] = 'good'
+                        paragraph.cfcls = GOOD
                     else:
-                        paragraph['cfclass'] = 'neargood'
+                        paragraph.cfcls = NEARGOOD
                 elif stopword_density >= stopwords_low:
-                    paragraph['cfclass'] = 'neargood'
+                    paragraph.cfcls = NEARGOOD
                 else:
-                    paragraph['cfclass'] = 'bad'
+                    paragraph.cfcls = BAD
 
 def _get_neighbour(i, paragraphs, ignore_neargood, inc, boundary):
     while i + inc != boundary:
         i += inc
-        c = paragraphs[i]['class']
-        if c in ['good', 'bad']:
+        c = paragraphs[i].cls
+        if c == GOOD or c == BAD:
             return c
-        if c == 'neargood' and not ignore_neargood:
+        if c == NEARGOOD and not ignore_neargood:
             return c
-    return 'bad'
+    return BAD
 
 def get_prev_neighbour(i, paragraphs, ignore_neargood):
-    """ Return the class of the paragraph at the top end of the short/neargood
-    paragraphs block. If ignore_neargood is True, than only 'bad' or 'good'
-    can be returned, otherwise 'neargood' can be returned, too.
+    """ Return the class code of the paragraph at the top end of the
+    short/neargood paragraphs block. If ignore_neargood is True, than only BAD
+    or GOOD can be returned, otherwise NEARGOOD can be returned, too.
     """
     return _get_neighbour(i, paragraphs, ignore_neargood, -1, -1)
 
 def get_next_neighbour(i, paragraphs, ignore_neargood):
-    """ Return the class of the paragraph at the bottom end of the short/neargood
-    paragraphs block. If ignore_neargood is True, than only 'bad' or 'good'
-    can be returned, otherwise 'neargood' can be returned, too.
+    """ Return the class code of the paragraph at the bottom end of the
+    short/neargood paragraphs block. If ignore_neargood is True, than only BAD
+    or GOOD can be returned, otherwise NEARGOOD can be returned, too.
     """
     return _get_neighbour(i, paragraphs, ignore_neargood, 1, len(paragraphs))
 
+def _prev_neighbours(classes, stop):
+    """ For every paragraph returns the class of the closest preceding paragraph
+    with a class in stop, BAD if there is no such paragraph.
+    """
+    neighbours = []
+    neighbour = BAD
+    for c in classes:
+        neighbours.append(neighbour)
+        if c in stop:
+            neighbour = c
+    return neighbours
+
+def _next_neighbours(classes, stop):
+    """ Same as _prev_neighbours but for the closest following paragraph."""
+    neighbours = _prev_neighbours(classes[::-1], stop)
+    neighbours.reverse()
+    return neighbours
+
+def _good_follows(paragraphs, offsets, max_heading_distance):
+    """ For every paragraph tells if a good paragraph follows it within
+    max_heading_distance characters. offsets[i] is the number of characters in
+    the paragraphs preceding paragraph i.
+    """
+    follows = [False] * len(paragraphs)
+    next_good = None
+    for i in xrange(len(paragraphs) - 1, -1, -1):
+        if next_good is not None:
+            follows[i] = offsets[next_good] - offsets[i + 1] <= max_heading_distance
+        if paragraphs[i].cls == GOOD:
+            next_good = i
+    return follows
+
 def revise_paragraph_classification(paragraphs, max_heading_distance=MAX_HEADING_DISTANCE_DEFAULT):
     """ Context-sensitive paragraph classification. Assumes that classify_pragraphs
     has already been called.
+
+    Neighbours and distances are precomputed for each pass so the whole
+    revision runs in linear time.
     """
     # copy classes
+    offsets = [0]
     for paragraph in paragraphs:
-        paragraph['class'] = paragraph['cfclass']
+        paragraph.cls = paragraph.cfcls
+        offsets.append(offsets[-1] + len(paragraph.text))
 
     # good headings
+    follows = _good_follows(paragraphs, offsets, max_heading_distance)
     for i, paragraph in enumerate(paragraphs):
-        if not (paragraph['heading'] and paragraph['class'] == 'short'):
-            continue
-        j = i + 1
-        distance = 0
-        while j < len(paragraphs) and distance <= max_heading_distance:
-            if paragraphs[j]['class'] == 'good':
-                paragraph['class'] = 'neargood'
-                break
-            distance += len(paragraphs[j]['text'])
-            j += 1
+        if paragraph.heading and paragraph.cls == SHORT and follows[i]:
+            paragraph.cls = NEARGOOD
 
     # classify short
-    new_classes = {}
+    classes = [paragraph.cls for paragraph in paragraphs]
+    prev_neighbours = _prev_neighbours(classes, (GOOD, BAD))
+    next_neighbours = _next_neighbours(classes, (GOOD, BAD))
+    prev_neargoods = _prev_neighbours(classes, (GOOD, BAD, NEARGOOD))
+    next_neargoods = _next_neighbours(classes, (GOOD, BAD, NEARGOOD))
     for i, paragraph in enumerate(paragraphs):
-        if paragraph['class'] != 'short':
+        if classes[i] != SHORT:
             continue
-        prev_neighbour = get_prev_neighbour(i, paragraphs, ignore_neargood=True)
-        next_neighbour = get_next_neighbour(i, paragraphs, ignore_neargood=True)
-        neighbours = set((prev_neighbour, next_neighbour))
-        if neighbours == set(['good']):
-            new_classes[i] = 'good'
-        elif neighbours == set(['bad']):
-            new_classes[i] = 'bad'
-        # it must be set(['good', 'bad'])
-        elif (prev_neighbour == 'bad' and get_prev_neighbour(i, paragraphs, ignore_neargood=False) == 'neargood') or \
-             (next_neighbour == 'bad' and get_next_neighbour(i, paragraphs, ignore_neargood=False) == 'neargood'):
-            new_classes[i] = 'good'
+        prev_neighbour = prev_neighbours[i]
+        next_neighbour = next_neighbours[i]
+        if prev_neighbour == next_neighbour:
+            # both GOOD or both BAD
+            paragraph.cls = prev_neighbour
+        # one is GOOD and the other one is BAD
+        elif (prev_neighbour == BAD and prev_neargoods[i] == NEARGOOD) or \
+             (next_neighbour == BAD and next_neargoods[i] == NEARGOOD):
+            paragraph.cls = GOOD
         else:
-            new_classes[i] = 'bad'
-
-    for i, c in new_classes.iteritems():
-        paragraphs[i]['class'] = c
+            paragraph.cls = BAD
 
-    # revise neargood
+    # revise neargood, there are no short paragraphs left so the preceding
+    # neighbour is always the previous paragraph with its revised class
+    next_neighbours = _next_neighbours(
+        [paragraph.cls for paragraph in paragraphs], (GOOD, BAD))
+    prev_neighbour = BAD
     for i, paragraph in enumerate(paragraphs):
-        if paragraph['class'] != 'neargood':
-            continue
-        prev_neighbour = get_prev_neighbour(i, paragraphs, ignore_neargood=True)
-        next_neighbour = get_next_neighbour(i, paragraphs, ignore_neargood=True)
-        if (prev_neighbour, next_neighbour) == ('bad', 'bad'):
-            paragraph['class'] = 'bad'
-        else:
-            paragraph['class'] = 'good'
+        if paragraph.cls == NEARGOOD:
+            if prev_neighbour == BAD and next_neighbours[i] == BAD:
+                paragraph.cls = BAD
+            else:
+                paragraph.cls = GOOD
+        prev_neighbour = paragraph.cls
 
     # more good headings
+    follows = _good_follows(paragraphs, offsets, max_heading_distance)
     for i, paragraph in enumerate(paragraphs):
-        if not (paragraph['heading'] and paragraph['class'] == 'bad' and paragraph['cfclass'] != 'bad'):
-            continue
-        j = i + 1
-        distance = 0
-        while j < len(paragraphs) and distance <= max_heading_distance:
-            if paragraphs[j]['class'] == 'good':
-                paragraph['class'] = 'good'
-                break
-            distance += len(paragraphs[j]['text'])
-            j += 1
+        if (paragraph.heading and paragraph.cls == BAD
+                and paragraph.cfcls != BAD and follows[i]):
+            paragraph.cls = GOOD
 
 def justext(html_text, stoplist, length_low=LENGTH_LOW_DEFAULT,
         length_high=LENGTH_HIGH_DEFAULT, stopwords_low=STOPWORDS_LOW_DEFAULT,
         stopwords_high=STOPWORDS_HIGH_DEFAULT, max_link_density=MAX_LINK_DENSITY_DEFAULT,
         max_heading_distance=MAX_HEADING_DISTANCE_DEFAULT, no_headings=NO_HEADINGS_DEFAULT,
         encoding=None, default_encoding=DEFAULT_ENCODING,
-        enc_errors=DEFAULT_ENC_ERRORS):
+        enc_errors=DEFAULT_ENC_ERRORS, xpaths=True, sax=True, stage=None):
     """ Converts an HTML page into a list of classified paragraphs. Each paragraph
-    is represented as a dictionary with the following attributes:
+    is represented as a Paragraph object which can also be accessed as a
+    dictionary with the following keys:
 
     text:
       Plain text content.
@@ -412,11 +763,20 @@ def justext(html_text, stoplist, length_low=LENGTH_LOW_DEFAULT,
     dom_path:
       A dom path to the paragraph in the originial HTML page.
 
+    node:
+      Index of the element which contains the paragraph in the list returned
+      by list_elements for the preprocessed tree.
+
     xpath:
-      A XPath expression which points to the paragraph.
+      A XPath expression which points to the paragraph, only present if
+      xpaths is True.
+
+    If stage is given, it's called with names of processing stages and
+    each of them is run within the context manager it returns, e.g. to
+    time them.
     """
     if isinstance(html_text, basestring):
-        html_text = decode_html(html_text, encoding, default_encoding, enc_errors)
+        uhtml_text = decode_html(html_text, encoding, default_encoding, enc_errors)
         try:
             root = lxml.html.fromstring(uhtml_text)
         except ValueError:
@@ -426,16 +786,31 @@ def justext(html_text, stoplist, length_low=LENGTH_LOW_DEFAULT,
     else:
         root = html_text
 
-    # preprocessing
-    remove_comments(root)
-    remove_non_content(root)
+    stage = stage or _no_stage
+
+    with stage('preprocess'):
+        remove_comments(root)
+        remove_non_content(root)
 
-    paragraphs = make_paragraphs(root)
-    classify_paragraphs(paragraphs, stoplist, length_low, length_high,
-        stopwords_low, stopwords_high, max_link_density, no_headings)
-    revise_paragraph_classification(paragraphs, max_heading_distance)
+    with stage('make_paragraphs'):
+        paragraphs = make_paragraphs(root, xpaths, sax)
+    with stage('classify_paragraphs'):
+        classify_paragraphs(paragraphs, stoplist, length_low, length_high,
+            stopwords_low, stopwords_high, max_link_density, no_headings)
+        revise_paragraph_classification(paragraphs, max_heading_distance)
     return paragraphs
 
+class _NoStage(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+def _no_stage(name, _stage=_NoStage()):
+    return _stage
+
 def html_escape(text):
     """ Converts < and > to &lt; and &gt;."""
     return text.replace('<', '&lt;').replace('>', '&gt;')
@@ -609,10 +984,8 @@ def main():
                 else:
                     if os.path.isfile(a):
                         try:
-                            fp_stoplist = codecs.open(a, 'r', 'utf-8')
-                            stoplist = set([l.strip() for l in fp_stoplist])
-                            fp_stoplist.close()
-                        except IOError, e:
+                            stoplist = load_stoplist(a)
+                        except (IOError, OSError), e:
                             raise JustextInvalidOptions(
                                 "Can't open %s for reading: %s" % (a, e))
                         except UnicodeDecodeError, e:
@@ -700,16 +1073,16 @@ def main():
             stopwords_low = 0
 
         if args == []:
-            fp_in = sys.stdin
+            html_text = sys.stdin.read()
         else:
+            # memory mapped, only the parsed tree is kept in memory
             try:
-                fp_in = open(args[0], 'r')
-            except IOError, e:
+                html_text = parse_html_file(args[0], encoding,
+                    default_encoding, enc_errors)
+            except (IOError, OSError), e:
                 raise JustextInvalidOptions(
                     "Can't open %s for reading: %s" % (args[0], e))
-                sys.exit(1)
 
-        html_text = fp_in.read()
         paragraphs = justext(html_text, stoplist, length_low, length_high,
             stopwords_low, stopwords_high, max_link_density, max_heading_distance,
             no_headings, encoding, default_encoding, enc_errors)
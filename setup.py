@@ -29,4 +29,5 @@ setup(
     entry_points="""
     [console_scripts]
     jaws = jaws:main
+    jaws-server = jaws.serve:main
     """)
@@ -0,0 +1,111 @@
+"""
+
+    tests.test_cache -- in-process and on-disk caches
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import multiprocessing
+
+from jaws.cache import SQLiteCache, SingleFlight
+
+class SQLiteCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def count(self):
+        db = sqlite3.connect(self.path)
+        try:
+            return db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        finally:
+            db.close()
+
+    def test_get_set(self):
+        cache = SQLiteCache(self.path)
+        cache.set('a', {'value': 1})
+        cache.set('b', 2, ttl=-1)
+        self.assertEqual(cache.get('a'), {'value': 1})
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1})
+        cache.delete('a')
+        self.assertEqual(cache.get('a'), None)
+
+    def test_purge_every(self):
+        cache = SQLiteCache(self.path, purge_every=3)
+        # the first write purges
+        for key in 'abc':
+            cache.set(key, key, ttl=-1)
+        self.assertEqual(self.count(), 2)
+        cache.set('d', 'd')
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(cache.get('d'), 'd')
+
+    def test_max_entries(self):
+        cache = SQLiteCache(self.path, max_entries=3, purge_every=10)
+        for key in 'abcde':
+            cache.set(key, key)
+        cache.set('a', 'a')
+        cache.set('f', 'f', ttl=60)
+        cache.purge()
+        # entries expiring first go first, then ones set earliest
+        self.assertEqual(
+            [key for key in 'abcdef' if cache.get(key) is not None],
+            ['a', 'd', 'e'])
+
+def _call(dir, store):
+    # a call taking a while, whose result may be cached in a file
+    result = os.path.join(dir, 'result')
+    if os.path.exists(result):
+        return
+    with open(os.path.join(dir, 'calls'), 'a') as f:
+        f.write('call\n')
+    time.sleep(0.5)
+    if store:
+        open(result, 'w').close()
+
+def _flight(dir, store):
+    SingleFlight(os.path.join(dir, 'lock')).do('key', _call, dir, store)
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def flights(self, store, count=4):
+        processes = [
+            multiprocessing.Process(target=_flight, args=(self.dir, store))
+            for _ in range(count)]
+        started = time.time()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        with open(os.path.join(self.dir, 'calls')) as f:
+            return len(f.readlines()), time.time() - started
+
+    def test_processes_wait(self):
+        (calls, elapsed) = self.flights(store=True)
+        self.assertEqual(calls, 1)
+
+    def test_processes_go_on_if_nothing_stored(self):
+        (calls, elapsed) = self.flights(store=False)
+        self.assertEqual(calls, 4)
+        # the first call, then the rest at once rather than one by one
+        self.assertLess(elapsed, 1.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+"""
+
+    tests.test_cleanup -- cleanup of extracted content
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    :func:`jaws.cleanup.cleanup` is compared with the chain of passes it
+    replaced, kept here as they were, on trees of pages in ``fixtures``
+    directory.
+
+"""
+
+import re
+import unittest
+from copy import deepcopy
+
+import lxml.html
+import lxml.html.clean
+
+from jaws import Document, process_paragraphs, attrs
+from jaws.cleanup import cleanup
+from jaws.utils import gen_matches_any
+
+from .test_justext import fixtures
+
+_patterns = dict(attrs._families)
+_very_bad_attr_re = gen_matches_any(*_patterns[attrs.VERY_BAD])
+_bad_attr_re = gen_matches_any(*_patterns[attrs.BAD])
+_good_attr_re = gen_matches_any(*_patterns[attrs.GOOD])
+
+def matches_attr(p, e, *attrs):
+    for attr in attrs:
+        if attr in e.attrib and p.search(e.attrib[attr]):
+            return True
+    return False
+
+def bottom_up_traverse(root):
+    for e in root:
+        if len(e) > 0:
+            for x in bottom_up_traverse(e):
+                yield x
+        yield e
+
+def remove_bad_attrs(root):
+    for el in list(bottom_up_traverse(root)):
+        if matches_attr(_very_bad_attr_re, el, 'class', 'id'):
+            el.drop_tree()
+        elif (matches_attr(_bad_attr_re, el, 'class', 'id')
+              and not any(matches_attr(_good_attr_re, x, 'class', 'id')
+                          for x in el.iter())):
+            el.drop_tree()
+
+def is_good(e):
+    return e.attrib.get('good') or e.xpath('*[@good="true"]')
+
+def remove_tail(root):
+    e = root.xpath('//*[@good="true"]')
+    if not e:
+        return
+    e = e[-1]
+    while e.getparent() is not None:
+        cur = e
+        while cur.getnext() is not None:
+            next = e.getnext()
+            if not is_good(next):
+                next.drop_tree()
+            cur = next
+        e = e.getparent()
+
+def garden(root):
+    for el in list(root.iter()):
+        for attr in ('class', 'id'):
+            if attr in el.attrib:
+                el.attrib.pop(attr)
+        if el.text and re.search('[a-zA-Z]', el.text):
+            el.text = re.sub('[\t\n\r]+', ' ', el.text)
+            el.text = re.sub('[ ]+', ' ', el.text)
+        else:
+            el.text = None
+        if el.tail and re.search('[a-zA-Z]', el.tail):
+            el.tail = re.sub('[\t\n\r]+', ' ', el.tail)
+            el.tail = re.sub('[ ]+', ' ', el.tail)
+        else:
+            el.tail = None
+    for el in list(bottom_up_traverse(root)):
+        if (len(el) == 0 and el.tag not in ('img',) and not el.text
+                and el.getparent() is not None):
+            el.drop_tree()
+        if (len(el) == 1 and not el.text and el.getparent() is not None):
+            el.drop_tag()
+
+def chained_cleanup(root):
+    remove_bad_attrs(root)
+    remove_tail(root)
+    lxml.html.clean.Cleaner(scripts=True, javascript=True, style=True,
+        links=True, meta=True, page_structure=True, forms=True,
+        remove_tags=['font'])(root)
+    garden(root)
+
+def trees(data):
+    """ Yield trees as cleaned up by :class:`jaws.Document`, and the raw
+    parsed tree with some elements marked good"""
+    doc = Document(data, url='http://example.com/')
+    root, paragraphs = doc.analysed
+    root = deepcopy(root)
+    process_paragraphs(root, paragraphs)
+    yield root
+    root = deepcopy(doc.parsed)
+    for n, el in enumerate(root.iter('p', 'div', 'td')):
+        if n % 7 == 3:
+            el.set('good', 'true')
+    yield root
+
+def _dump(root):
+    return (lxml.html.tostring(root, encoding='unicode'),
+        root.tag, root.text, root.tail, dict(root.attrib))
+
+class CleanupTest(unittest.TestCase):
+
+    def test_same_as_chain(self):
+        for name, data in fixtures():
+            for root in trees(data):
+                expected = deepcopy(root)
+                chained_cleanup(expected)
+                cleanup(root)
+                self.assertEqual(_dump(root), _dump(expected), name)
+
+    def test_unsafe(self):
+        for name, data in fixtures():
+            for root in trees(data):
+                cleanup(root)
+                html = lxml.html.tostring(root)
+                for unsafe in ('<script', '<style', 'javascript:', 'onload',
+                        'onerror', 'class=', 'id=', 'good='):
+                    self.assertNotIn(unsafe, html, name)
+
+if __name__ == '__main__':
+    unittest.main()
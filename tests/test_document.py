@@ -0,0 +1,56 @@
+"""
+
+    tests.test_document -- documents and their sources
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import os
+import shutil
+import urllib
+import tempfile
+import unittest
+
+from jaws import Document
+from jaws.batch import extract
+
+PAGE = (
+    '<html><head><meta property="og:image" content="images/cover.jpg">'
+    '</head><body><p>Text</p></body></html>')
+
+class FromFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'page.html')
+        with open(self.path, 'wb') as f:
+            f.write(PAGE)
+        self.cwd = os.getcwd()
+        self.base = 'file://' + urllib.pathname2url(self.dir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def test_url(self):
+        doc = Document.from_file(self.path)
+        self.assertEqual(doc.url, self.base + '/page.html')
+        self.assertEqual(doc.image, self.base + '/images/cover.jpg')
+        doc = Document.from_file(self.path, url='http://example.com/a/b')
+        self.assertEqual(doc.image, 'http://example.com/a/images/cover.jpg')
+
+    def test_relative(self):
+        os.chdir(self.dir)
+        doc = Document.from_file('page.html')
+        self.assertEqual(doc.image, self.base + '/images/cover.jpg')
+        doc = Document.from_file('page.html', url='sub/other.html')
+        self.assertEqual(doc.url, self.base + '/sub/other.html')
+        self.assertEqual(doc.image, self.base + '/sub/images/cover.jpg')
+
+    def test_batch(self):
+        os.chdir(self.dir)
+        result = extract(('page.html', ('image',)))
+        self.assertEqual(result['image'], self.base + '/images/cover.jpg')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+"""
+
+    tests.test_fetch -- fetching documents over HTTP
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Fetcher is run against a local server which counts connections made to
+    it, to check they are kept alive and reused when it's safe to.
+
+"""
+
+import threading
+import unittest
+import urllib2
+import BaseHTTPServer
+from SocketServer import ThreadingMixIn
+
+from jaws.fetch import Fetcher, detect_encoding, SNIFF_SIZE
+
+PAGE = (
+    '<html><head><meta charset="windows-1251"></head>'
+    '<body><p>\xef\xf0\xe8\xe2\xe5\xf2</p></body></html>')
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        if self.path == '/redirect':
+            self.respond(302, 'moved', [('Location', '/page')])
+        elif self.path == '/utf8':
+            self.respond(200, 'text', [
+                ('Content-Type', 'text/html; charset=utf-8')])
+        elif self.path == '/page':
+            self.respond(200, PAGE, [('Content-Type', 'text/html')])
+        else:
+            self.respond(404, 'not found')
+
+    def respond(self, status, body, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _Server(ThreadingMixIn, BaseHTTPServer.HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        self.lock = threading.Lock()
+        self.connections = 0
+
+class FetcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = _Server()
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.fetcher = Fetcher(timeout=5)
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.server.server_port, path)
+
+    def test_fetch(self):
+        fetched = self.fetcher.fetch(self.url('/page'))
+        self.assertEqual(fetched.url, self.url('/page'))
+        self.assertEqual(fetched.data, PAGE)
+        self.assertEqual(fetched.encoding, 'windows-1251')
+        self.assertEqual(fetched.headers.gettype(), 'text/html')
+        fetched = self.fetcher.fetch(self.url('/utf8'))
+        self.assertEqual(fetched.encoding, 'utf-8')
+
+    def test_keep_alive(self):
+        for path in ('/page', '/page', '/redirect', '/page'):
+            fetched = self.fetcher.fetch(self.url(path))
+            self.assertEqual(fetched.url, self.url('/page'))
+            self.assertEqual(fetched.data, PAGE)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_keep_alive_after_error(self):
+        with self.assertRaises(urllib2.HTTPError) as cm:
+            self.fetcher.fetch(self.url('/missing'))
+        self.assertEqual(cm.exception.code, 404)
+        self.assertEqual(cm.exception.read(), 'not found')
+        cm.exception.close()
+        self.fetcher.fetch(self.url('/page'))
+        self.assertEqual(self.server.connections, 1)
+
+    def test_partially_read_response_is_not_reused(self):
+        fetcher = Fetcher(timeout=5, max_size=10)
+        try:
+            for _ in range(2):
+                fetched = fetcher.fetch(self.url('/page'))
+                self.assertEqual(fetched.data, PAGE[:10])
+        finally:
+            fetcher.close()
+        self.assertEqual(self.server.connections, 2)
+        # the server is still fine with connections being dropped
+        self.assertEqual(self.fetcher.fetch(self.url('/page')).data, PAGE)
+
+    def test_max_requests_per_host(self):
+        fetcher = Fetcher(timeout=0.2, max_requests_per_host=1)
+        try:
+            response = fetcher.open(self.url('/page'))
+            with self.assertRaises(urllib2.URLError):
+                fetcher.open(self.url('/page'))
+            response.read()
+            response.close()
+            fetcher.open(self.url('/page')).close()
+        finally:
+            fetcher.close()
+
+class DetectEncodingTest(unittest.TestCase):
+
+    script = '<script>%s</script>' % ('var x = 1;\n' * (SNIFF_SIZE / 10))
+
+    def test_charset(self):
+        self.assertEqual(detect_encoding(PAGE, 'koi8-r'), 'koi8-r')
+        self.assertEqual(detect_encoding(PAGE, 'unknown'), 'windows-1251')
+
+    def test_ascii(self):
+        self.assertEqual(detect_encoding('<p>text</p>'), 'ascii')
+
+    def test_utf8_after_ascii_prefix(self):
+        data = '<html><head>%s</head><body><p>Caf\xc3\xa9</p></body>' % (
+            self.script)
+        self.assertGreater(data.index('\xc3'), SNIFF_SIZE)
+        self.assertEqual(detect_encoding(data), 'utf-8')
+
+    def test_legacy_after_ascii_prefix(self):
+        text = (u'\u041f\u0440\u0438\u0432\u0435\u0442, '
+            u'\u043a\u0430\u043a \u0434\u0435\u043b\u0430? ' * 50)
+        data = '<html><head>%s</head><body><p>%s</p></body>' % (
+            self.script, text.encode('windows-1251'))
+        self.assertEqual(detect_encoding(data), 'windows-1251')
+
+if __name__ == '__main__':
+    unittest.main()
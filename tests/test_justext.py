@@ -0,0 +1,58 @@
+"""
+
+    tests.test_justext -- paragraphs made by justext
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Paragraphs made by walking the tree are compared with those made from
+    SAX events, on pages in ``fixtures`` directory.
+
+"""
+
+import os
+import glob
+import unittest
+from copy import deepcopy
+
+import lxml.html
+
+import justext
+from justext.core import (
+    make_paragraphs, walk_paragraphs, remove_comments, remove_non_content)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+def fixtures():
+    for path in sorted(glob.glob(os.path.join(FIXTURES, '*.html'))):
+        with open(path, 'rb') as f:
+            yield os.path.basename(path), f.read()
+
+def _dump(paragraphs):
+    return [dict((key, p[key]) for key in p.keys()) for p in paragraphs]
+
+class ParagraphMakerTest(unittest.TestCase):
+
+    def assertSameParagraphs(self, name, root, xpaths):
+        sax = make_paragraphs(deepcopy(root), xpaths=xpaths, sax=True)
+        walked = walk_paragraphs(deepcopy(root), xpaths=xpaths)
+        self.assertEqual(_dump(walked), _dump(sax), name)
+
+    def test_walk_paragraphs(self):
+        for name, data in fixtures():
+            root = lxml.html.fromstring(data)
+            for xpaths in (True, False):
+                # comments, scripts and the like are left for the walk
+                self.assertSameParagraphs(name, root, xpaths)
+                preprocessed = deepcopy(root)
+                remove_comments(preprocessed)
+                remove_non_content(preprocessed)
+                self.assertSameParagraphs(name, preprocessed, xpaths)
+
+    def test_justext(self):
+        stoplist = justext.get_stoplist('English')
+        for name, data in fixtures():
+            self.assertEqual(
+                _dump(justext.justext(data, stoplist, sax=False)),
+                _dump(justext.justext(data, stoplist, sax=True)), name)
+
+if __name__ == '__main__':
+    unittest.main()
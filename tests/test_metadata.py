@@ -0,0 +1,65 @@
+"""
+
+    tests.test_metadata -- metadata from document's <head>
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import unittest
+from cStringIO import StringIO
+
+from jaws import Document
+from jaws.metadata import parse_metadata, read_metadata
+
+HEAD = (
+    '<html><head><title> Page </title>'
+    '<meta name="author" content="John Doe">'
+    '%s'
+    '<meta property="og:image" content="/cover.jpg">'
+    '<meta name="twitter:image" content="/twitter.jpg">'
+    '<meta itemprop="name" content="Name">'
+    '</head>')
+BODY = (
+    '<body><p>Text</p>'
+    '<meta property="og:image" content="/body.jpg"></body></html>')
+PIXEL = (
+    '<noscript><img height="1" width="1" style="display:none" '
+    'src="https://www.facebook.com/tr?id=1&amp;ev=PageView"></noscript>')
+
+class MetadataTest(unittest.TestCase):
+
+    def check(self, metadata):
+        self.assertEqual(metadata.title, 'Page')
+        self.assertEqual(metadata.author, 'John Doe')
+        self.assertEqual(metadata.og, {'image': '/cover.jpg'})
+        self.assertEqual(metadata.twitter, {'image': '/twitter.jpg'})
+        self.assertEqual(metadata.itemprops, {'name': ['Name']})
+
+    def test_parse(self):
+        self.check(parse_metadata(HEAD % '' + BODY))
+
+    def test_stops_at_body(self):
+        metadata = parse_metadata(HEAD % '' + BODY, chunk_size=16)
+        self.assertEqual(metadata.properties, {'og:image': ['/cover.jpg']})
+        # no </head>
+        metadata = parse_metadata(
+            '<title>Page</title><p>Text</p><meta name="author" content="x">')
+        self.assertEqual(metadata.title, 'Page')
+        self.assertEqual(metadata.author, None)
+
+    def test_noscript_in_head(self):
+        self.check(parse_metadata(HEAD % PIXEL + BODY))
+        self.check(parse_metadata(HEAD % (PIXEL * 2) + BODY, chunk_size=16))
+
+    def test_read(self):
+        response = StringIO(HEAD % PIXEL + BODY)
+        data, metadata = read_metadata(response, chunk_size=16)
+        self.check(metadata)
+        self.assertEqual(data + response.read(), HEAD % PIXEL + BODY)
+
+    def test_document_image(self):
+        doc = Document(HEAD % PIXEL + BODY, url='http://example.com/page')
+        self.assertEqual(doc.image, 'http://example.com/cover.jpg')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+
+    tests.test_metrics -- timings of extraction stages
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import os
+import time
+import threading
+import unittest
+
+from jaws.cache import LRUCache, TieredCache
+from jaws.metrics import Timings, Metrics, thread_time
+
+def _busy(seconds):
+    started = time.time()
+    while time.time() - started < seconds:
+        pass
+
+class TimingsTest(unittest.TestCase):
+
+    @unittest.skipIf(thread_time() is None, 'no CPU time of threads')
+    def test_cpu_of_thread(self):
+        thread = threading.Thread(target=_busy, args=(0.5,))
+        timings = Timings()
+        with timings.stage('sleep'):
+            thread.start()
+            time.sleep(0.3)
+        thread.join()
+        with timings.stage('busy'):
+            _busy(0.1)
+        (wall, cpu) = timings.stages['sleep']
+        self.assertGreaterEqual(wall, 0.3)
+        self.assertLess(cpu, 0.1)
+        (wall, cpu) = timings.stages['busy']
+        self.assertGreater(cpu, 0.05)
+
+class MetricsTest(unittest.TestCase):
+
+    def test_render(self):
+        metrics = Metrics()
+        timings = Timings()
+        timings.add('parse', 0.02, 0.01)
+        timings.sizes['bytes'] = 5000
+        metrics.observe(timings)
+        metrics.observe(timings)
+        lines = metrics.render().splitlines()
+        pid = os.getpid()
+        for line in (
+                'jaws_stage_seconds_bucket'
+                    '{pid="%d",stage="parse",le="0.025"} 2' % pid,
+                'jaws_stage_seconds_count{pid="%d",stage="parse"} 2' % pid,
+                'jaws_document_bytes_bucket{pid="%d",le="+Inf"} 2' % pid,
+                'jaws_document_bytes_count{pid="%d"} 2' % pid):
+            self.assertIn(line, lines)
+        if thread_time() is not None:
+            self.assertIn('jaws_stage_cpu_seconds_total'
+                '{pid="%d",stage="parse"} 0.02' % pid, lines)
+
+    def test_caches(self):
+        metrics = Metrics()
+        lru = LRUCache()
+        tiered = TieredCache(LRUCache(), LRUCache())
+        metrics.add_cache('lru', lru)
+        metrics.add_cache('tiered', tiered)
+        lru.set('a', 1)
+        lru.get('a')
+        tiered.tiers[1].set('b', 2)
+        tiered.get('b')
+        tiered.get('b')
+        lines = metrics.render().splitlines()
+        for labels, counter, value in (
+                ('cache="lru",tier="0"', 'hits', 1),
+                ('cache="tiered",tier="0"', 'hits', 1),
+                ('cache="tiered",tier="1"', 'hits', 1),
+                ('cache="tiered",tier="0"', 'misses', 1),
+                ('cache="tiered",tier="1"', 'misses', 0)):
+            self.assertIn('jaws_cache_%s_total{pid="%d",%s} %d' % (
+                counter, os.getpid(), labels, value), lines)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+
+    tests.test_serve -- threaded HTTP server for jaws.server application
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+"""
+
+import time
+import threading
+import unittest
+
+from webob.exc import HTTPGatewayTimeout
+
+from jaws import server
+from jaws.serve import ProcessPoolExtractor
+
+def _extract_fields(data, url, encoding, fields):
+    # stands for pathological pages which take forever to extract
+    if data == 'hang':
+        while True:
+            time.sleep(1)
+    return dict((field, data) for field in fields), None
+
+class ProcessPoolExtractorTest(unittest.TestCase):
+
+    def setUp(self):
+        # workers are forked after this, so they see it too
+        self.extract_fields = server.extract_fields
+        server.extract_fields = _extract_fields
+        self.extractor = ProcessPoolExtractor(processes=2, timeout=0.5)
+
+    def tearDown(self):
+        self.extractor.close()
+        server.extract_fields = self.extract_fields
+
+    def extract(self, data):
+        return self.extractor(data, 'http://example.com', None, ['title'])
+
+    def test_extract(self):
+        self.assertEqual(self.extract('page'), ({'title': 'page'}, None))
+
+    def test_timeouts(self):
+        for _ in range(4):
+            self.assertRaises(HTTPGatewayTimeout, self.extract, 'hang')
+            self.assertEqual(self.extract('page'), ({'title': 'page'}, None))
+        # stuck workers were terminated along with their pools
+        self.assertEqual(len(self.extractor._jobs), 1)
+
+    def test_timeout_during_other_jobs(self):
+        results = []
+        def _extract(data):
+            try:
+                results.append(self.extract(data))
+            except HTTPGatewayTimeout as e:
+                results.append(e)
+        threads = [threading.Thread(target=_extract, args=(data,))
+            for data in ('hang', 'hang', 'page')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 3)
+        self.assertEqual(self.extract('page'), ({'title': 'page'}, None))
+        self.assertEqual(len(self.extractor._jobs), 1)
+
+if __name__ == '__main__':
+    unittest.main()
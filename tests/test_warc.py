@@ -0,0 +1,173 @@
+"""
+
+    tests.test_warc -- reading documents from WARC and ARC archives
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Archives are generated in a temporary directory, a gzipped one has a
+    gzip member per record as crawlers write them.
+
+"""
+
+import os
+import gzip
+import zlib
+import shutil
+import tempfile
+import unittest
+from cStringIO import StringIO
+
+from jaws.warc import read_records, iter_records
+
+PAGE = '<html><head><title>Page</title></head><body>%s</body></html>' % (
+    '<p>Some text of the page.</p>' * 100)
+
+def http(body, content_type='text/html', headers=(), status='200 OK'):
+    head = ['HTTP/1.1 %s' % status, 'Content-Type: %s' % content_type]
+    head.extend(headers)
+    return '\r\n'.join(head) + '\r\n\r\n' + body
+
+def gzipped(data):
+    z = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return z.compress(data) + z.flush()
+
+def chunked(data, size=1000):
+    return ''.join(
+        '%x\r\n%s\r\n' % (len(data[i:i + size]), data[i:i + size])
+        for i in range(0, len(data), size)) + '0\r\n\r\n'
+
+def warc_record(type, uri, block):
+    return (
+        'WARC/1.0\r\n'
+        'WARC-Type: %s\r\n'
+        'WARC-Target-URI: <%s>\r\n'
+        'WARC-Date: 2013-01-01T12:00:00Z\r\n'
+        'Content-Type: application/http; msgtype=%s\r\n'
+        'Content-Length: %d\r\n'
+        '\r\n%s\r\n\r\n') % (type, uri, type, len(block), block)
+
+def arc_record(url, block):
+    return '%s 127.0.0.1 20130101120000 text/html %d\n%s\n' % (
+        url, len(block), block)
+
+def gzip_members(records):
+    out = StringIO()
+    for record in records:
+        f = gzip.GzipFile(fileobj=out, mode='wb')
+        f.write(record)
+        f.close()
+    return out.getvalue()
+
+WARC_RECORDS = [
+    warc_record('warcinfo', '', 'software: tests\r\n'),
+    warc_record('request', 'http://example.com/page.html',
+        'GET /page.html HTTP/1.1\r\n\r\n'),
+    warc_record('response', 'http://example.com/page.html', http(PAGE)),
+    warc_record('response', 'http://example.com/ru.html',
+        http(PAGE, 'text/html; charset=windows-1251')),
+    warc_record('response', 'http://example.com/logo.png',
+        http('\x89PNG', 'image/png')),
+    warc_record('response', 'http://example.com/missing.html',
+        http('not found', status='404 Not Found')),
+    warc_record('response', 'http://other.org/gzip.html',
+        http(gzipped(PAGE), headers=['Content-Encoding: gzip'])),
+    warc_record('response', 'http://other.org/chunked.html',
+        http(chunked(PAGE), headers=['Transfer-Encoding: chunked'])),
+    ]
+
+ARC_DESC = '1 0 tests\nURL IP-address Archive-date Content-type Length\n'
+ARC_RECORDS = [
+    'filedesc://tests.arc 0.0.0.0 20130101120000 text/plain %d\n%s\n' % (
+        len(ARC_DESC), ARC_DESC),
+    arc_record('http://example.com/page.html', http(PAGE)),
+    arc_record('http://example.com/logo.png', http('\x89PNG', 'image/png')),
+    arc_record('http://other.org/page.html', http(PAGE)),
+    ]
+
+class ReadRecordsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'wb') as f:
+            f.write(data)
+        return filename
+
+    def read(self, name, data, **kwargs):
+        return list(iter_records([self.write(name, data)], **kwargs))
+
+    def test_warc(self):
+        records = self.read('test.warc', ''.join(WARC_RECORDS))
+        self.assertEqual([r.url for r in records], [
+            'http://example.com/page.html',
+            'http://example.com/ru.html',
+            'http://other.org/gzip.html',
+            'http://other.org/chunked.html',
+            ])
+        for record in records:
+            self.assertEqual(record.status, 200)
+            self.assertEqual(record.content_type, 'text/html')
+            self.assertEqual(record.payload, PAGE)
+        self.assertEqual(records[0].date, '2013-01-01T12:00:00Z')
+        self.assertEqual(records[0].charset, None)
+        self.assertEqual(records[1].charset, 'windows-1251')
+
+    def test_gzipped_warc(self):
+        records = self.read('test.warc.gz', gzip_members(WARC_RECORDS))
+        self.assertEqual(len(records), 4)
+        self.assertEqual([r.payload for r in records], [PAGE] * 4)
+
+    def test_gzipped_arc(self):
+        records = self.read('test.arc.gz', gzip_members(ARC_RECORDS))
+        self.assertEqual([r.url for r in records], [
+            'http://example.com/page.html', 'http://other.org/page.html'])
+        self.assertEqual(records[0].date, '20130101120000')
+        self.assertEqual(records[0].payload, PAGE)
+
+    def test_content_types(self):
+        records = self.read('test.warc.gz', gzip_members(WARC_RECORDS),
+            content_types=('image/png',))
+        self.assertEqual([(r.url, r.payload) for r in records],
+            [('http://example.com/logo.png', '\x89PNG')])
+        records = self.read('test.warc.gz', gzip_members(WARC_RECORDS),
+            content_types=None)
+        self.assertEqual(len(records), 5)
+
+    def test_url_pattern(self):
+        records = self.read('test.warc.gz', gzip_members(WARC_RECORDS),
+            url_pattern=r'^http://other\.org/')
+        self.assertEqual([r.url for r in records], [
+            'http://other.org/gzip.html', 'http://other.org/chunked.html'])
+        records = self.read('test.arc.gz', gzip_members(ARC_RECORDS),
+            url_pattern=r'example\.com')
+        self.assertEqual([r.url for r in records],
+            ['http://example.com/page.html'])
+
+    def test_truncation(self):
+        records = self.read('test.warc.gz', gzip_members(WARC_RECORDS),
+            max_size=100)
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[0].payload, PAGE[:100])
+        # the gzipped payload is decompressed up to max_size only
+        self.assertEqual(records[2].payload, PAGE[:100])
+
+    def test_decompression_bomb(self):
+        bomb = gzipped('\0' * (20 * 1024 * 1024))
+        data = warc_record('response', 'http://example.com/bomb.html',
+            http(bomb, headers=['Content-Encoding: gzip']))
+        records = self.read('bomb.warc', data, max_size=1024 * 1024)
+        self.assertEqual(len(records[0].payload), 1024 * 1024)
+
+    def test_not_an_archive(self):
+        with self.assertRaises(ValueError):
+            list(read_records(StringIO('<html></html>')))
+
+    def test_empty(self):
+        self.assertEqual(list(read_records(StringIO(''))), [])
+
+if __name__ == '__main__':
+    unittest.main()